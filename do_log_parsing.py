@@ -1,84 +1,164 @@
+import mmap
+import os
 import os.path as p
-from numpy import fft
+import numpy as np
 import pyggwave
 import ast
+import codecs
+import csv
 
-import xlwt
-from xlwt import Workbook
+# Print every written row.
+DEBUG = False
+# Start of the message logged after every written packet when slow logging is on.
+NOISE_SUM_MARKER = 'Overall noise sum: '
 
-data_dict = {}
-data_dict2 = {}
 
+class LogRecords:
+    """
+    Frame records parsed from a log file, stored column-wise.
 
-def read_to_dict(file_name, dict):
-    with open(p.join(p.dirname(p.abspath(__file__)), file_name)) as file:
-        lines = file.readlines()
+    `index` maps hex of frame data to the row of its last occurrence.
+    """
 
-        for i, line in enumerate(lines):
-            skip = True
+    __slots__ = ('index', 'dtimes', 'is_writing', 'lengths', 'ecc', 'writer_data')
 
-            if 'Writing data' in line and 'Verbose (frame)' in line:
-                skip = False
+    def __init__(self):
+        self.index = {}
+        self.dtimes = []
+        self.is_writing = []
+        self.lengths = []
+        self.ecc = []
+        self.writer_data = []
 
-            if 'Received data' in line and 'Verbose (frame)' in line:
-                skip = False
+    def append(self, key, dtime, is_writing, length, writer_data):
+        self.index[key] = len(self.lengths)
+        self.dtimes.append(dtime)
+        self.is_writing.append(is_writing)
+        self.lengths.append(length)
+        self.ecc.append(pyggwave.raw__get_ecc_bytes_for_length(length))
+        self.writer_data.append(writer_data)
 
-            if skip:
-                continue
+    def finish(self):
+        self.dtimes = np.array(self.dtimes, dtype=np.float64).reshape(-1, 3)
+        self.is_writing = np.array(self.is_writing, dtype=bool)
+        self.lengths = np.array(self.lengths, dtype=np.int32)
+        self.ecc = np.array(self.ecc, dtype=np.int32)
+        return self
 
-            ls = line.split()
+    def seconds(self, rows):
+        return self.dtimes[rows] @ np.array([3600.0, 60.0, 1.0])
 
-            if len(ls) < 2:
-                continue
+    def record(self, row):
+        return (
+            self.dtimes[row].tolist(),
+            bool(self.is_writing[row]),
+            int(self.lengths[row]),
+            int(self.ecc[row]),
+            self.writer_data[row],
+        )
 
-            dtime = ls[1].split(':')
 
-            if len(dtime) != 3:
-                continue
+def _iter_lines(mm):
+    pos = 0
+    size = len(mm)
 
-            dtime = [float(x) for x in dtime]
-            secs_time = dtime[2]
-            data_index = line.index(' data: ')
-            data_str = line[data_index + 7:]
-            data = ast.literal_eval(data_str)
-            writer_data = ()
+    while pos < size:
+        nl = mm.find(b'\n', pos)
 
-            if 'Writing data' in line:
-                if len(lines) < i + 1:
-                    line2 = lines[i + 1]
+        if nl == -1:
+            nl = size
 
-                    if line2.startswith('Overall noise sum'):
-                        fft_sum_spl = line2[19:].split(',')
-                        fft_sum = float(fft_sum_spl[0])
-                        fft_data_sum = float(fft_sum_spl[1].split(': ')[1])
-                        data_freqs = float(fft_sum_spl[1].split(': ')[1])
-                        writer_data = (fft_sum, fft_data_sum, data_freqs)
+        yield pos, nl
+        pos = nl + 1
 
-            dict[data.hex()] = (dtime, 'Writing data' in line, len(data), pyggwave.raw__get_ecc_bytes_for_length(len(data)), writer_data)
 
+def parse_bytes_literal(data_str):
+    data_str = data_str.strip()
 
-def merge_dicts(dict1, dict2, callback, input_changer):
-    data = []
+    if data_str[:2] in ("b'", 'b"') and data_str[-1] == data_str[1]:
+        return codecs.escape_decode(data_str[2:-1].encode())[0]
+
+    return ast.literal_eval(data_str)
+
+
+def read_records(file_name):
+    records = LogRecords()
+
+    with open(p.join(p.dirname(p.abspath(__file__)), file_name), 'rb') as file:
+        if os.fstat(file.fileno()).st_size > 0:
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                _read_mapped_records(mm, records)
+
+    return records.finish()
+
+
+def _read_mapped_records(mm, records):
+    for start, end in _iter_lines(mm):
+        if mm.find(b'Verbose (frame)', start, end) == -1:
+            continue
+
+        is_writing = mm.find(b'Writing data', start, end) != -1
+
+        if not is_writing and mm.find(b'Received data', start, end) == -1:
+            continue
+
+        line = mm[start:end].decode()
+        ls = line.split()
+
+        if len(ls) < 2:
+            continue
 
-    for k, v1 in dict1.items():
-        if k in dict2:
-            v2 = dict2[k]
+        dtime = ls[1].split(':')
 
-            if v1[1] == v2[1]:
-                continue
+        if len(dtime) != 3:
+            continue
 
-            sender = v1 if v1[1] else v2
-            receiver = v2 if v1[1] else v1
-            sender_secs = sender[0][0] * 3600 + sender[0][1] * 60 + sender[0][2]
-            receiver_secs = receiver[0][0] * 3600 + receiver[0][1] * 60 + receiver[0][2]
+        dtime = [float(x) for x in dtime]
+        data_index = line.index(' data: ')
+        data_str = line[data_index + 7:]
+        data = parse_bytes_literal(data_str)
+        writer_data = ()
 
-            if sender_secs > receiver_secs:
-                continue
+        if is_writing and end < len(mm):
+            next_end = mm.find(b'\n', end + 1)
+            line2 = mm[end + 1:next_end if next_end != -1 else len(mm)].decode()
 
-            if receiver_secs - sender_secs > 3.0:
-                continue
+            # Line is logged with time, prefixes and tag before the message.
+            marker_index = line2.find(NOISE_SUM_MARKER)
 
-            data.append((sender, receiver))
+            if marker_index != -1:
+                fft_sum_spl = line2[marker_index + len(NOISE_SUM_MARKER):].split(', ')
+                fft_sum = float(fft_sum_spl[0])
+                fft_data_sum = float(fft_sum_spl[1].split(': ')[1])
+                data_freqs = float(fft_sum_spl[2].split(': ')[1])
+                writer_data = (fft_sum, fft_data_sum, data_freqs)
+
+        records.append(data.hex(), dtime, is_writing, len(data), writer_data)
+
+
+def merge_records(records1, records2, callback, input_changer):
+    keys = [k for k in records1.index if k in records2.index]
+    rows1 = np.fromiter((records1.index[k] for k in keys), dtype=np.intp, count=len(keys))
+    rows2 = np.fromiter((records2.index[k] for k in keys), dtype=np.intp, count=len(keys))
+    t1 = records1.seconds(rows1)
+    t2 = records2.seconds(rows2)
+    sent1 = records1.is_writing[rows1]
+    sent2 = records2.is_writing[rows2]
+
+    sender_secs = np.where(sent1, t1, t2)
+    receiver_secs = np.where(sent1, t2, t1)
+    mask = (
+        (sent1 != sent2) &
+        (receiver_secs >= sender_secs) &
+        (receiver_secs - sender_secs <= 3.0)
+    )
+
+    data = []
+
+    for i in np.flatnonzero(mask):
+        v1 = records1.record(rows1[i])
+        v2 = records2.record(rows2[i])
+        data.append((v1, v2) if v1[1] else (v2, v1))
 
     input_changer(data)
 
@@ -86,55 +166,58 @@ def merge_dicts(dict1, dict2, callback, input_changer):
         callback(*element)
 
 
-wb = Workbook()
-sheet1 = wb.add_sheet('Auto-generated data')
-sheet1.write(0, 0, 'Sender time')
-sheet1.write(0, 1, 'Receiver time')
-sheet1.write(0, 2, 'Time delta')
-sheet1.write(0, 3, 'Packet size')
-sheet1.write(0, 4, 'Error correction size')
-sheet1.write(0, 5, 'Total size')
-sheet1.write(0, 6, 'Average speed')
-sheet1.write(0, 7, 'Average noise')
-sheet1.write(0, 8, 'Data noise')
-sheet1.write(0, 9, 'Data frequency count')
-y = 1
+CSV_HEADER = [
+    'Sender time',
+    'Receiver time',
+    'Time delta',
+    'Packet size',
+    'Error correction size',
+    'Total size',
+    'Average speed',
+    'Average noise',
+    'Data noise',
+    'Data frequency count',
+]
+rows = []
 
 
-def write_to_excel(sender, receiver):
-    global y
+def add_row(sender, receiver):
     sender_time = sender[0][2]
     receiver_time = receiver[0][2] + (60 if sender[0][1] < receiver[0][1] else 0)
-    sheet1.write(y, 0, sender_time)
-    sheet1.write(y, 1, receiver_time)
     delta_time = receiver_time - sender_time
-    sheet1.write(y, 2, delta_time)
-    sheet1.write(y, 3, sender[2])
-    sheet1.write(y, 4, sender[3])
     total_size = sender[2] + sender[3]
-    sheet1.write(y, 5, total_size)
-    sheet1.write(y, 6, total_size / delta_time * 8)
+    row = [
+        sender_time,
+        receiver_time,
+        delta_time,
+        sender[2],
+        sender[3],
+        total_size,
+        total_size / delta_time * 8,
+    ]
 
     if len(sender[4]) > 0:
-        sheet1.write(y, 7, sender[4][0])
-        sheet1.write(y, 8, sender[4][1])
-        sheet1.write(y, 9, sender[4][2])
+        row.extend(sender[4][:3])
+
+    rows.append(row)
+
+    if DEBUG:
+        print(f'Row {len(rows)}:', sender, receiver)
 
-    print(f'Row {y}:', sender, receiver)
-    y += 1
-    return
 
+def write_to_csv(file_name, rows):
+    with open(file_name, 'w', newline='') as file:
+        writer = csv.writer(file)
+        writer.writerow(CSV_HEADER)
+        writer.writerows(rows)
 
-read_to_dict('log.txt', data_dict)
-read_to_dict('log2.txt', data_dict2)
-merge_dicts(
-    data_dict,
-    data_dict2,
-    write_to_excel,
+
+merge_records(
+    read_records('log.txt'),
+    read_records('log2.txt'),
+    add_row,
     lambda x: x.sort(
         key=lambda y: y[0][2]
     ),
 )
-wb.save('generated.xlsx')
-
-# print(data_dict)
+write_to_csv('generated.csv', rows)
@@ -1,8 +1,11 @@
+from collections.abc import Generator
+from contextlib import contextmanager
 from typing import Any
 
 from pyggwave import GGWave, Parameters, OperatingMode, Protocol
 import pyggwave
 import pyaudio
+import queue
 import threading
 import time
 import struct
@@ -10,76 +13,166 @@ import sys
 import ctypes
 import base64
 
+import numpy as np
+from numpy.typing import NDArray
+
 from error_corrector import REDUNDANCY_SIZE, ErrorCorrector
 from listener import fourie_transform
 from log import LOGGER
 from optional.visualize import Visualizer
+from ring import SampleRing
 from stream import BufferedStream
 from cryptoec import KeyExchanger, SymmetricKey
 from ui import UIProcessor
 
 
+def _libasound_error_handler(filename: bytes, line: int, function: bytes, err: int, fmt: bytes) -> None:
+    LOGGER.error_pyaudio('libasound:', f'{filename.decode()}:{line}:', f'{function.decode()}', err, fmt.decode().replace('%s', '?'))
+
+
+_ALSA_ERROR_HANDLER_FUNC = ctypes.CFUNCTYPE(
+    None,
+    ctypes.c_char_p,
+    ctypes.c_int,
+    ctypes.c_char_p,
+    ctypes.c_int,
+    ctypes.c_char_p,
+)
+# Must stay alive as long as the process, libasound may call it at any time
+# once it was installed.
+_C_ALSA_ERROR_HANDLER = _ALSA_ERROR_HANDLER_FUNC(_libasound_error_handler)
+_libasound: ctypes.CDLL | None = None
+
+
+@contextmanager
+def _redirect_alsa_errors() -> Generator[None]:
+    """
+    Routes errors printed by libasound inside the block to `LOGGER`.
+    """
+    global _libasound
+
+    if _libasound is None:
+        _libasound = ctypes.cdll.LoadLibrary('libasound.so')
+
+    _libasound.snd_lib_error_set_handler(_C_ALSA_ERROR_HANDLER)
+
+    try:
+        yield
+    finally:
+        _libasound.snd_lib_error_set_handler(None)
+
+
 class AlternativeStream(BufferedStream):
     SEND_INIT_INTERVAL: float = 1.0
     SEND_INTERVAL_SENDER: tuple[float, float] = 0.2, 0.3
     SEND_INTERVAL_RECEIVER: tuple[float, float] = 0.7, 0.8
     MAX_RECEIVING_TIME: float = 6.0
+    # Maximum size of data sent in one GGWave transmission before error
+    # correction bytes are added to it.
+    MAX_BATCH_PAYLOAD: int = 140 - REDUNDANCY_SIZE
+    # Amount of output chunks that can be queued for playing at once.
+    OUTPUT_RING_SLOTS: int = 256
+    SAMPLE_RATE: int = 48_000
+    # Amount of frames in one input block, same as GGWave frame size.
+    INPUT_BLOCK_FRAMES: int = 1024
+    # Amount of frames played per output callback. Must be a multiple of
+    # GGWave frame size. Larger chunks mean fewer callbacks but add latency
+    # to each transmission.
+    OUTPUT_CHUNK_FRAMES: int = 2 * INPUT_BLOCK_FRAMES
+    # Amount of input blocks which are passed to GGWave decoder at once.
+    RX_BATCH_BLOCKS: int = 4
+    # Amount of decoder batches without new data after which another peer is
+    # considered to have stopped transmitting.
+    RX_SILENT_BATCHES: int = 1
+    # Maximum amount of packets whose samples are kept in `encoded_cache`.
+    ENCODED_CACHE_SIZE: int = 8
+    # Time in seconds output stream may take to play written samples on top
+    # of their duration before the write is aborted.
+    OUTPUT_DRAIN_SLACK: float = 1.0
 
     transformer: GGWave
+    error_corrector: ErrorCorrector
     ctx: pyaudio.PyAudio
     input_stream: pyaudio.Stream
     output_stream: pyaudio.Stream
     input_lock: threading.Lock
+    # Notified by reader thread every time data is added to input buffer.
+    input_ready: threading.Condition
     output_lock: threading.Lock
     reader: threading.Thread
     writer: threading.Thread
     output_chunk_bytes: int
+    # Encoded frames which are waiting to be played by output stream callback.
+    output_ring: SampleRing
+    output_drained: threading.Event
+    # Notified when output buffer or write turn changes.
+    output_ready: threading.Condition
+    # Played when there is nothing in `output_ring`. PyAudio accepts any
+    # buffer, so array is returned from output callback as-is.
+    silence: NDArray[np.float32]
+    # Chunk returned from output callback. PyAudio copies it before the next
+    # callback, so the same array is reused every time.
+    output_scratch: NDArray[np.float32]
+    # Packets decoded by input stream callback which were not processed yet.
+    received_packets: queue.Queue[bytes]
+    # Input blocks which were not passed to GGWave decoder yet.
+    rx_accumulator: bytearray
+    rx_batch_bytes: int
+    # Decoded packets which are held until the channel becomes silent.
+    rx_pending: list[bytes]
+    rx_silent_batches: int
+    # Whether receiving state was already reset during current write turn.
+    rx_reset: bool
     protocol: Protocol = Protocol.ULTRASOUND_FASTEST
+    # Value of `time.monotonic()` when connection was established.
     first_packet_time: float | None = None
     send_interval: tuple[float, float]
+    # Send interval of the other peer.
+    peer_send_interval: tuple[float, float]
+    # Value of `time.monotonic()` when current reception was noticed.
     receiving_start: float | None = None
     last_input_block: bytes | None = None
-
-    def _libasound_error_handler(self, filename: bytes, line: bytes, function: bytes, err: int, fmt: bytes, *args) -> None:
-        LOGGER.error_pyaudio('libasound:', f'{filename.decode()}:{line}:', f'{function.decode()}', err, fmt.decode().replace('%s', '?'))
+    # Samples of recently written packets, from the least to the most recently
+    # used one. Packets are resent as-is on retry and handshake packets are
+    # the same on every reconnect, so they are encoded only once.
+    encoded_cache: dict[bytes, NDArray[np.float32]]
+    # Last batch encoded by `_pre_encode_output_batch()`.
+    pre_encoded_batch: bytes | None = None
+    # GGWave instance reused by all streams, so reconnecting does not rebuild
+    # its DSP state.
+    _shared_transformer: GGWave | None = None
 
     def __init__(self, turn_write: bool, fake: bool = False) -> None:
         if fake:
             return
 
-        for i in range(9):
-            GGWave.rx_toggle_protocol(Protocol(i), False)
-            GGWave.tx_toggle_protocol(Protocol(i), False)
-
-        GGWave.rx_toggle_protocol(self.protocol, True)
-        GGWave.tx_toggle_protocol(self.protocol, True)
-
-        self.transformer = GGWave(
-            Parameters(
-                operating_mode=OperatingMode.RX_AND_TX.value,
-            ),
-        )
-
-        ERROR_HANDLER_FUNC = ctypes.CFUNCTYPE(
-            None,
-            ctypes.c_char_p,
-            ctypes.c_int,
-            ctypes.c_char_p,
-            ctypes.c_int,
-            ctypes.c_char_p,
-        )
-
-        c_error_handler = ERROR_HANDLER_FUNC(self._libasound_error_handler)
-
-        asound = ctypes.cdll.LoadLibrary('libasound.so')
-        # Set error handler
-        asound.snd_lib_error_set_handler(c_error_handler)
-        self.ctx = pyaudio.PyAudio()
-        asound.snd_lib_error_set_handler(None)
-
-        self.input_stream = self.ctx.open(format=pyaudio.paFloat32, channels=1, rate=48_000, input=True, frames_per_buffer=1024)
-        self.output_chunk_bytes = 1024 * 4
-        self.output_stream = self.ctx.open(format=pyaudio.paFloat32, channels=1, rate=48_000, output=True, frames_per_buffer=self.output_chunk_bytes // 4)
+        self.transformer = self._get_transformer()
+
+        self.error_corrector = ErrorCorrector()
+        ErrorCorrector.warm_up()
+
+        with _redirect_alsa_errors():
+            self.ctx = pyaudio.PyAudio()
+
+        self.output_chunk_bytes = self.OUTPUT_CHUNK_FRAMES * 4
+        self.output_ring = SampleRing(self.OUTPUT_RING_SLOTS, self.output_chunk_bytes // 4)
+        self.output_drained = threading.Event()
+        self.output_ready = threading.Condition()
+        self.silence = np.zeros(self.output_chunk_bytes // 4, dtype=np.float32)
+        self.silence.flags.writeable = False
+        self.output_scratch = np.empty(self.output_chunk_bytes // 4, dtype=np.float32)
+        self.encoded_cache = {}
+        self.received_packets = queue.Queue()
+        self.rx_accumulator = bytearray()
+        self.rx_batch_bytes = self.INPUT_BLOCK_FRAMES * 4 * self.RX_BATCH_BLOCKS
+        self.rx_pending = []
+        self.rx_silent_batches = 0
+        self.rx_reset = False
+        # Whole decoder batch is requested from PortAudio at once, so the
+        # input callback (and GIL acquisition) happens once per batch instead
+        # of once per block.
+        self.input_stream = self.ctx.open(format=pyaudio.paFloat32, channels=1, rate=self.SAMPLE_RATE, input=True, frames_per_buffer=self.INPUT_BLOCK_FRAMES * self.RX_BATCH_BLOCKS, stream_callback=self._input_callback, start=False)
+        self.output_stream = self.ctx.open(format=pyaudio.paFloat32, channels=1, rate=self.SAMPLE_RATE, output=True, frames_per_buffer=self.output_chunk_bytes // 4, stream_callback=self._output_callback, start=False)
         self.input_lock = threading.Lock()
         self.output_lock = threading.Lock()
         self.reader = threading.Thread(target=self._read_loop)
@@ -87,56 +180,147 @@ class AlternativeStream(BufferedStream):
 
         if turn_write:
             self.send_interval = self.SEND_INTERVAL_SENDER
+            self.peer_send_interval = self.SEND_INTERVAL_RECEIVER
         else:
             self.send_interval = self.SEND_INTERVAL_RECEIVER
+            self.peer_send_interval = self.SEND_INTERVAL_SENDER
 
         super().__init__(turn_write)
+        self.input_ready = threading.Condition(self.input_lock)
+        # Callbacks rely on state initialized above, so streams are started
+        # only after it.
+        self.input_stream.start_stream()
+        self.output_stream.start_stream()
         self.reader.start()
         self.writer.start()
 
+    @classmethod
+    def _get_transformer(cls) -> GGWave:
+        if cls._shared_transformer is None:
+            for i in range(9):
+                GGWave.rx_toggle_protocol(Protocol(i), False)
+                GGWave.tx_toggle_protocol(Protocol(i), False)
+
+            GGWave.rx_toggle_protocol(cls.protocol, True)
+            GGWave.tx_toggle_protocol(cls.protocol, True)
+
+            cls._shared_transformer = GGWave(
+                Parameters(
+                    operating_mode=OperatingMode.RX_AND_TX.value,
+                ),
+            )
+        elif cls._shared_transformer.rx_receiving():
+            # Drop whatever previous stream was receiving.
+            pyggwave.raw__rx_stop_receiving(cls._shared_transformer.instance)
+
+        return cls._shared_transformer
+
     def _decode_data(self, data: bytes) -> bytes:
         LOGGER.verbose_coder('Original data before decoding:', data)
-        decoded: bytes = ErrorCorrector(data).decode()
+        decoded: bytes = self.error_corrector.decode_bytes(data)
         LOGGER.verbose_coder('Decoded data:', decoded)
         return decoded
 
     def _encode_data(self, data: bytes) -> bytes:
         LOGGER.verbose_coder('Original data before encoding:', data)
-        encoded: bytes = ErrorCorrector(data).encode()
+        encoded: bytes = self.error_corrector.encode_bytes(data)
         LOGGER.verbose_coder('Encoded data:', encoded)
         return encoded
 
-    def _read_loop(self) -> None:
-        try:
-            while True:
-                if self._turn_write:
-                    if self.transformer.rx_receiving():
-                        pyggwave.raw__rx_stop_receiving(self.transformer.instance)
-                    frames: int = self.input_stream.get_read_available()
-                    self.input_stream.read(frames, exception_on_overflow=False)
-                    time.sleep(0.01)
-                    continue
+    def _input_callback(self, in_data: bytes | None, frame_count: int, time_info: Any, status_flags: int) -> tuple[None, int]:
+        if in_data is None:
+            return (None, pyaudio.paContinue)
+
+        if self._turn_write:
+            # Decoder is not fed while writing, so its state only has to be
+            # reset once per write turn.
+            if not self.rx_reset:
+                if self.transformer.rx_receiving():
+                    pyggwave.raw__rx_stop_receiving(self.transformer.instance)
+
+                self.rx_accumulator.clear()
+                self._release_pending_packets()
+                self.rx_reset = True
+
+            return (None, pyaudio.paContinue)
 
-                frame: bytes = self.input_stream.read(1024, exception_on_overflow=False)
-                self.last_input_block = frame
-                data: bytes | None = self.transformer.decode(frame)
+        self.rx_reset = False
+        self.last_input_block = in_data
+        data: bytes | None
 
-                if data:
-                    LOGGER.verbose_frame('Received data:', data)
+        if not self.rx_accumulator and len(in_data) >= self.rx_batch_bytes:
+            # Input stream delivers whole batches, so usually they can be
+            # decoded without copying them into accumulator.
+            data = self.transformer.decode(in_data)
+        else:
+            self.rx_accumulator += in_data
+
+            if len(self.rx_accumulator) < self.rx_batch_bytes:
+                return (None, pyaudio.paContinue)
 
-                    with self.input_lock:
-                        # Sleep until another peer stops transmitting its message.
-                        time.sleep(0.15)
-                        self.input_buffer += self._decode_data(data)
-        except OSError as exc:
-            LOGGER.error3(exc)
+            # `GGWave.decode()` only accepts `bytes` (not buffers), so
+            # accumulated input is copied once here.
+            data = self.transformer.decode(bytes(self.rx_accumulator))
+            self.rx_accumulator.clear()
+
+        if data:
+            self.rx_pending.append(data)
+            self.rx_silent_batches = 0
+        elif self.rx_pending and not self.transformer.rx_receiving():
+            self.rx_silent_batches += 1
+
+            if self.rx_silent_batches >= self.RX_SILENT_BATCHES:
+                self._release_pending_packets()
+
+        return (None, pyaudio.paContinue)
+
+    def _release_pending_packets(self) -> None:
+        for packet in self.rx_pending:
+            self.received_packets.put(packet)
+
+        self.rx_pending.clear()
+        self.rx_silent_batches = 0
+
+    def _output_callback(self, in_data: bytes | None, frame_count: int, time_info: Any, status_flags: int) -> tuple[NDArray[np.float32], int]:
+        if not self.output_ring.pop_into(self.output_scratch):
+            # `set()` takes event's lock, so it is skipped on idle callbacks
+            # after the first one.
+            if not self.output_drained.is_set():
+                self.output_drained.set()
+
+            return (self.silence, pyaudio.paContinue)
+
+        return (self.output_scratch, pyaudio.paContinue)
+
+    def _read_loop(self) -> None:
+        while True:
+            data: bytes = self.received_packets.get()
+            LOGGER.verbose_frame('Received data:', data)
+            # Error correction is done before taking the lock, so the consumer
+            # is not blocked by it.
+            decoded: bytes = self._decode_data(data)
+
+            with self.input_ready:
+                self.input_buffer += decoded
+                # Waiters are notified before the lock is released, so they
+                # are woken up only when they can acquire it.
+                self.input_ready.notify_all()
+
+    def wait_input(self, timeout: float | None, size: int = 1, precision: float = 0.05) -> None:
+        if timeout is not None and timeout <= 0.0:
+            return
+
+        with self.input_ready:
+            self.input_ready.wait_for(lambda: len(self.input_buffer) >= size, timeout)
 
     def _try_write(self) -> bool:
+        time_now: float = time.monotonic()
+
         if self.transformer.rx_receiving():
             if self.receiving_start is None:
-                self.receiving_start = time.time()
+                self.receiving_start = time_now
 
-            delta_time: float = time.time() - self.receiving_start
+            delta_time: float = time_now - self.receiving_start
 
             if delta_time > self.MAX_RECEIVING_TIME:
                 # self.transformer.rx_stop_receiving()
@@ -149,73 +333,197 @@ class AlternativeStream(BufferedStream):
             # print(f'{time.time():.2f}', f'Skipping write turn: receiving: {self.receiving_start:.2f}, {delta_time:.2f}')
             return False
 
+        if not self._turn_write:
+            # print(f'{time.time():.2f}', 'Skipping write turn: not write turn')
+            return False
+
         if self.first_packet_time is not None:
-            delta_time = time.time() - self.first_packet_time
+            delta_time = time_now - self.first_packet_time
             interval_start, interval_end = self.send_interval
             interval_point: float = delta_time % self.SEND_INIT_INTERVAL
 
             if interval_point < interval_start or interval_point > interval_end:
                 # print(f'{time.time():.2f}', f'Skipping write turn: interval point {interval_point:.2f} is not on interval [{interval_start:.2f}; {interval_end:.2f}]')
+                # Only the interval is left to wait for and the decoder is
+                # not receiving, so the batch can be encoded now instead of
+                # inside the interval.
+                self._pre_encode_output_batch()
                 return False
 
             # print(f'{time.time():.2f}', f'Went through initial checks: {interval_point:.2f} [{interval_start:.2f}; {interval_end:.2f}]')
 
-        if not self._turn_write:
-            # print(f'{time.time():.2f}', 'Skipping write turn: not write turn')
-            return False
+        # Writer thread only gets here once there is data, so the lock is
+        # taken blocking. It is only contended by `clear_output_buffer()`,
+        # which may empty the buffer in the meantime.
+        with self.output_lock:
+            if len(self.output_buffer) == 0:
+                # print(f'{time.time():.2f}', 'Skipping write turn: output buffer empty')
+                return False
 
-        if len(self.output_buffer) == 0:
-            # print(f'{time.time():.2f}', 'Skipping write turn: output buffer empty')
-            return False
+            self._write(self._pop_output_batch())
 
-        if self.output_lock.acquire(blocking=False):
-            try:
-                data: bytes = self.output_buffer.pop()
-                self._write(self._encode_data(data))
-            finally:
-                self.output_lock.release()
+        self._output_changed()
+        return True
+
+    def _pre_encode_output_batch(self) -> None:
+        """
+        Encodes the batch which is going to be written next, so `_write()`
+        reuses its samples. Every batch is encoded only once.
+        """
+        with self.output_lock:
+            if len(self.output_buffer) == 0:
+                return
+
+            batch: bytes = self._peek_output_batch()[0]
+
+            if batch == self.pre_encoded_batch:
+                return
+
+            self._encode_samples(batch)
+            self.pre_encoded_batch = batch
+
+    def _peek_output_batch(self) -> tuple[bytes, int]:
+        """
+        Returns as many queued chunks as fit into one transmission joined
+        together and amount of these chunks. Receiver sees input as a byte
+        stream, so chunk boundaries do not need to be kept.
+
+        Output buffer must not be empty.
+        """
+        batch: bytes = self.output_buffer[0]
+        count: int = 1
+
+        # Chunks are accessed by index, as `write()` may append to the buffer
+        # while it is being iterated.
+        if len(self.output_buffer) == 1 or len(batch) + len(self.output_buffer[1]) > self.MAX_BATCH_PAYLOAD:
+            return batch, count
 
-            return True
+        joined: bytearray = bytearray(batch)
 
-        return False
+        while count < len(self.output_buffer) and len(joined) + len(self.output_buffer[count]) <= self.MAX_BATCH_PAYLOAD:
+            joined += self.output_buffer[count]
+            count += 1
+
+        return bytes(joined), count
+
+    def _pop_output_batch(self) -> bytes:
+        batch, count = self._peek_output_batch()
+
+        for _ in range(count):
+            self.output_buffer.popleft()
+
+        return batch
+
+    def _output_changed(self) -> None:
+        with self.output_ready:
+            self.output_ready.notify_all()
+
+    def wait_output(self, precision: float = 0.05) -> None:
+        with self.output_ready:
+            self.output_ready.wait_for(lambda: len(self.output_buffer) == 0 and not self.output_lock.locked())
+
+    def time_until_peer_interval_end(self) -> float:
+        """
+        Returns time left until the end of the other peer's current send
+        interval, or of its next one if current interval already ended.
+
+        Before connection is established intervals have no phase, so the end
+        offset of the other peer's interval is returned as a fixed delay.
+        """
+        interval_end: float = self.peer_send_interval[1]
+
+        if self.first_packet_time is None:
+            return interval_end
+
+        interval_point: float = (time.monotonic() - self.first_packet_time) % self.SEND_INIT_INTERVAL
+
+        if interval_point <= interval_end:
+            return interval_end - interval_point
+
+        return self.SEND_INIT_INTERVAL - interval_point + interval_end
+
+    def _chunk_duration(self) -> float:
+        return self.output_chunk_bytes / 4 / self.SAMPLE_RATE
 
     def _write_loop(self) -> None:
-        silence: bytes = b'\0' * self.output_chunk_bytes
+        # Output stream plays one chunk per that interval, so there is no need
+        # to check whether something can be written more often.
+        chunk_duration: float = self._chunk_duration()
 
         while True:
+            # Nothing can be written until there is data and write turn, so
+            # the thread sleeps until `write()` or `turn_write()` wakes it up.
+            with self.output_ready:
+                self.output_ready.wait_for(lambda: self._turn_write and len(self.output_buffer) > 0)
+
             if not self._try_write():
-                self.output_stream.write(silence)
+                time.sleep(chunk_duration)
 
     def _write(self, data: bytes) -> None:
         LOGGER.verbose_frame('Writing data:', data)
 
         if LOGGER.is_logging_slow() and self.last_input_block is not None:
-            fft = fourie_transform(self.last_input_block)
-            fft_sum: float = sum(fft)
+            fft = fourie_transform(self.last_input_block, np.float32)
+            fft_sum: float = float(fft.sum())
             xvals = Visualizer.generate_x_values(len(fft), 24_000)
-            fft_data_sum: float = 0.0
-            total_terms: int = 0
+            data_mask = (xvals >= 15_000.0) & (xvals <= 19_500.0)
+            fft_data_sum: float = float(fft[data_mask].sum())
+            total_terms: int = int(data_mask.sum())
 
-            for i, xval in enumerate(xvals):
-                if xval < 15_000.0 or xval > 19_500.0:
-                    continue
+            LOGGER.file_only(f'Overall noise sum: {fft_sum}, data channel noise sum: {fft_data_sum}, data frequencies: {total_terms}')
 
-                fft_data_sum += float(fft[i])
-                total_terms += 1
+        samples: NDArray[np.float32] = self._encode_samples(data)
+        # Output callback stops being called if the stream fails or is
+        # stopped, so the write must not wait for it forever.
+        deadline: float = time.monotonic() + len(samples) / self.SAMPLE_RATE + self.OUTPUT_DRAIN_SLACK
+        pushed: int = 0
 
-            LOGGER.file_only(f'Overall noise sum: {fft_sum}, data channel noise sum: {fft_data_sum}, data frequencies: {total_terms}')
+        # Event is cleared before chunks are added, so a callback which finds
+        # the ring empty after that can only set it once they were played.
+        self.output_drained.clear()
+
+        while True:
+            pushed += self.output_ring.push(samples[pushed:])
+
+            if pushed >= len(samples):
+                break
+
+            if time.monotonic() >= deadline:
+                LOGGER.error('Output stream stopped playing, write aborted')
+                return
+
+            # Ring is full, wait until output stream plays some of it.
+            time.sleep(self._chunk_duration())
+
+        if not self.output_drained.wait(max(deadline - time.monotonic(), 0.0)):
+            LOGGER.error('Output stream stopped playing, write aborted')
 
-        frames: bytes = self.transformer.encode(data, protocol=self.protocol, volume=100)
-        self.output_stream.write(frames, len(frames) // 4)
+    def _encode_samples(self, data: bytes) -> NDArray[np.float32]:
+        samples: NDArray[np.float32] | None = self.encoded_cache.pop(data, None)
+
+        if samples is not None:
+            LOGGER.verbose_coder('Reusing encoded samples')
+        else:
+            if len(self.encoded_cache) >= self.ENCODED_CACHE_SIZE:
+                del self.encoded_cache[next(iter(self.encoded_cache))]
+
+            frames: bytes = self.transformer.encode(self._encode_data(data), protocol=self.protocol, volume=100)
+            samples = np.frombuffer(frames, dtype=np.float32)
+
+        # Reinserted entry becomes the most recently used one.
+        self.encoded_cache[data] = samples
+        return samples
 
     def clear_input_buffer(self) -> None:
         with self.input_lock:
-            self.input_buffer = bytes()
+            self.input_buffer.clear()
 
     def clear_output_buffer(self) -> None:
         with self.output_lock:
             self.output_buffer.clear()
 
+        self._output_changed()
+
     def dispose(self) -> None:
         self.input_stream.stop_stream()
         self.input_stream.close()
@@ -233,6 +541,16 @@ class ReliableTransceiver:
     # Retry (unused)
     RTR: int = 4
 
+    # Format of ACK packets: packet id and response code.
+    BYTE_PAIR: struct.Struct = struct.Struct('<BB')
+    # Format of length prefix of data sent with `send()`.
+    LENGTH: struct.Struct = struct.Struct('<I')
+    # Packet ids are bytes, so every possible `ACK` and `SYN|ACK` packet is
+    # built once.
+    ACK_PACKETS: tuple[bytes, ...] = tuple(map(bytes, zip(range(256), [ACK] * 256)))
+    SYN_ACK_PACKETS: tuple[bytes, ...] = tuple(map(bytes, zip(range(256), [SYN | ACK] * 256)))
+    SYN_PACKET: bytes = bytes((SYN,))
+
     last_received_packet: int = -1
     last_sent_packet: int = -1
     prev_packet_time: float | None = None
@@ -246,30 +564,27 @@ class ReliableTransceiver:
 
     def read_equals(self, timeout: float, data: bytes, precision: float = 0.01) -> bool:
         size: int = len(data)
-        start_time: float = time.time()
-        result: bytes = bytes()
+        deadline: float = time.monotonic() + timeout
+        result: bytearray = bytearray()
         self.stream.turn_read()
 
         while True:
-            time_now: float = time.time()
-
-            if time_now >= start_time + timeout:
+            if time.monotonic() >= deadline:
                 return False
 
-            buffer: bytes = self.stream.read(size, block=False)
-            result += buffer
+            buffer: bytes = self.stream.read(size - len(result), block=False)
 
-            if len(result) > size:
-                return False
+            if buffer:
+                result += buffer
 
-            if len(result) == size:
-                if result == data:
-                    return True
+                if not data.startswith(result):
+                    LOGGER.warning('Buffer', bytes(result), '(received) != buffer', data, '(expected)')
+                    return False
 
-                LOGGER.warning(f'Buffer {result} (received) != buffer {data} (expected)')
-                return False
+                if len(result) == size:
+                    return True
 
-            time.sleep(precision)
+            self.stream.wait_input(deadline - time.monotonic(), precision=precision)
 
     def read_insecure(
             self,
@@ -283,115 +598,112 @@ class ReliableTransceiver:
 
         self.last_received_packet += 1
 
-        start_time: float = time.time()
-        result: bytes = bytes()
+        deadline: float = time.monotonic() + abort_timeout
+        # Discarded packets postpone `deadline`, but by no more than one send
+        # interval in total, so a stream of them can not keep the read alive.
+        max_deadline: float = deadline + self.stream.SEND_INIT_INTERVAL
+        result: bytearray = bytearray()
         self.stream.turn_read()
 
         while True:
-            time_now: float = time.time()
-
-            if time_now - start_time >= abort_timeout:
+            if time.monotonic() >= deadline:
                 # TODO: Reset everything and try to connect from the very beginning again
                 raise ConnectionAbortedError()
 
-            LOGGER.spam('Reading data with size 1')
-            buffer: bytes = self.stream.read(1, block=False)
+            # Packet id and payload are sent in one transmission, so the
+            # already decoded part of payload is read together with the id.
+            LOGGER.spam('Reading data with size', 1 + size)
+            buffer: bytes = self.stream.read(1 + size, block=False)
             if buffer:
                 LOGGER.verbose('Received data:', buffer)
 
             if len(buffer) == 0:
-                time.sleep(precision)
+                self.stream.wait_input(deadline - time.monotonic(), precision=precision)
                 continue
 
-            if len(buffer) > 1:
-                LOGGER.warning('Read more bytes from buffer than expected')
-
-            batch_id: int = struct.unpack('<B', buffer)[0]
+            batch_id: int = buffer[0]
 
             if len(buffer) >= 1:
+                # Rest of unexpected packet may still be transmitted, so it is
+                # waited for (until the end of other peer's send interval) to
+                # be fully discarded.
+                discard_delay: float = self.stream.time_until_peer_interval_end()
+
                 if batch_id > self.last_received_packet:
-                    LOGGER.warning(f'Received packet with unexpected id: {batch_id}, expected {self.last_received_packet}')
-                    # TODO: Properly ensure that we are fully discarding that packet
-                    time.sleep(1.0)
-                    raise ConnectionAbortedError()
-                    # time.sleep(0.5)
-                    # start_time += 0.5
-                    # self.stream.clear_input_buffer()
-                    # continue
+                    LOGGER.warning('Received packet with unexpected id: ', batch_id, ', expected ', self.last_received_packet, sep='')
+                    # It is not ACK-ed, so the other peer resends it until
+                    # `deadline` is reached if the expected one got lost.
+                    time.sleep(discard_delay)
+                    deadline = min(deadline + discard_delay, max_deadline)
+                    self.stream.clear_input_buffer()
+                    continue
 
                 if batch_id < self.last_received_packet:
-                    LOGGER.warning(f'Already ACK-ed packet received', batch_id, self.last_received_packet)
-                    # TODO: Properly ensure that we are fully discarding that packet
-                    time.sleep(1.0)
-                    start_time += 1.0
+                    LOGGER.warning('Already ACK-ed packet received', batch_id, self.last_received_packet)
+                    time.sleep(discard_delay)
+                    deadline = min(deadline + discard_delay, max_deadline)
                     self.stream.clear_input_buffer()
                     # We are sending ACK even if `send_ack` is False as it only determines
                     # such behavior if `batch_id` == `self.last_received_packet`.
                     self.stream.turn_write()
                     LOGGER.verbose('Responding with ACK to packet', batch_id)
-                    self.stream.write(struct.pack('<BB', batch_id, self.ACK))
+                    self.stream.write(self.ACK_PACKETS[batch_id])
                     LOGGER.verbose('Done')
                     self.stream.turn_read()
                     continue
 
                 break
 
-        ack_packet: bytes = struct.pack('<BB', batch_id, self.ACK)
+        ack_packet: bytes = self.ACK_PACKETS[batch_id]
+        result += memoryview(buffer)[1:]
+        size -= len(buffer) - 1
 
         while size > 0:
             LOGGER.debug('Trying to read data with size', size)
-            time_now: float = time.time()
-
-            if time_now - start_time >= abort_timeout:
+            if time.monotonic() >= deadline:
                 # TODO: Reset everything and try to connect from the very beginning again
                 raise ConnectionAbortedError()
 
+            # Payload usually arrives in the same packet as its id, so this
+            # returns at once and the whole payload is taken in one read.
+            self.stream.wait_input(deadline - time.monotonic(), size, precision)
             LOGGER.verbose('Receiving packet')
             buffer: bytes = self.stream.read(size, block=False)
             LOGGER.verbose('Done')
             result += buffer
             size -= len(buffer)
 
-            if size < 0:
-                LOGGER.verbose('Returning more bytes that requested!')
-
-            if size <= 0:
-                if send_ack:
-                    self.stream.turn_write()
-                    LOGGER.verbose('Responding to received data with ACK')
-                    self.stream.write(ack_packet)
-                    LOGGER.verbose('Done')
-                    self.stream.turn_read()
-                break
-
-            time.sleep(precision)
+        if send_ack:
+            self.stream.turn_write()
+            LOGGER.verbose('Responding to received data with ACK')
+            self.stream.write(ack_packet)
+            LOGGER.verbose('Done')
+            self.stream.turn_read()
 
         LOGGER.debug('Done data read')
 
         if send_ack:
-            return result
+            return bytes(result)
 
-        return ack_packet, result
+        return ack_packet, bytes(result)
 
     def write_insecure(self, data: bytes, resend_timeout: float = 3.0, abort_retries: int = 5, precision: float = 0.01) -> None:
         LOGGER.verbose('Sending chunk:', data)
         self.last_sent_packet += 1
         self.last_sent_packet %= 256
-        full_data: bytes = struct.pack('<B', self.last_sent_packet) + data
+        full_data: bytes = bytes((self.last_sent_packet,)) + data
         self.stream.turn_write()
         LOGGER.verbose('Exact data:', full_data)
         self.stream.write(full_data)
         LOGGER.verbose('Sent data')
 
         size: int = 2
-        last_resend_time: float = time.time()
-        result: bytes = bytes()
+        next_resend: float = time.monotonic() + resend_timeout
+        result: bytearray = bytearray()
         retries: int = 0
 
         while True:
-            time_now: float = time.time()
-
-            if time_now - last_resend_time >= resend_timeout:
+            if time.monotonic() >= next_resend:
                 self.stream.turn_write()
                 LOGGER.info('Resending data:', full_data)
                 self.stream.write(full_data)
@@ -402,22 +714,18 @@ class ReliableTransceiver:
                     # TODO: Reset everything and try to connect from the very beginning again
                     raise ConnectionAbortedError()
 
-                last_resend_time = time.time()
+                next_resend = time.monotonic() + resend_timeout
 
             self.stream.turn_read()
-            LOGGER.spam(f'Waiting for confirmation ({size})...')
+            LOGGER.spam('Waiting for confirmation (', size, ')...', sep='')
             buffer: bytes = self.stream.read(size, block=False)
             result += buffer
             size -= len(buffer)
 
             if size <= 0:
-                LOGGER.verbose('Got confirmation:', result)
-
-                if size < 0:
-                    LOGGER.error('Returning more bytes that requested!')
-                    break
+                LOGGER.verbose('Got confirmation:', bytes(result))
 
-                response: tuple[int, int] = struct.unpack('<BB', result)
+                response: tuple[int, int] = self.BYTE_PAIR.unpack(result)
                 failure: bool = False
 
                 if response[1] != self.ACK:
@@ -425,12 +733,12 @@ class ReliableTransceiver:
                     failure = True
 
                 if response[0] != self.last_sent_packet:
-                    LOGGER.warning(f'Received ACK for different packet ({response[0]} but {self.last_sent_packet} was sent)')
+                    LOGGER.warning('Received ACK for different packet (', response[0], ' but ', self.last_sent_packet, ' was sent)', sep='')
                     failure = True
 
                 if failure:
                     self.stream.turn_write()
-                    LOGGER.info(f'Resending data on failure:', full_data)
+                    LOGGER.info('Resending data on failure:', full_data)
                     self.stream.write(full_data)
                     LOGGER.verbose('Resent data')
                     retries += 1
@@ -439,30 +747,25 @@ class ReliableTransceiver:
                         # TODO: Reset everything and try to connect from the very beginning again
                         raise ConnectionAbortedError()
 
-                    last_resend_time = time.time()
+                    next_resend = time.monotonic() + resend_timeout
                 else:
                     return
 
-            time.sleep(precision)
+            self.stream.wait_input(next_resend - time.monotonic(), size, precision)
 
     def send(self, orig_data: bytes, chunk_size_max: int = 140) -> None:
         encrypted_data: bytes = self.session_key.encrypt(orig_data)
-        len_data = struct.pack('<I', len(encrypted_data))
+        len_data = self.LENGTH.pack(len(encrypted_data))
         LOGGER.verbose('Sending data; original data:')
         encrypted_data: bytes = len_data + encrypted_data
         LOGGER.verbose('Encrypted:', encrypted_data)
 
-        data_chunks: list[bytes] = []
-        data_left: bytes = encrypted_data
         nonce_size: int = 8
         chunk_size: int = chunk_size_max - nonce_size - REDUNDANCY_SIZE
-
-        while len(data_left) >= chunk_size:
-            data_chunks.append(data_left[:chunk_size])
-            data_left = data_left[chunk_size:]
-
-        if len(data_left) > 0:
-            data_chunks.append(data_left)
+        data_chunks: list[bytes] = [
+            encrypted_data[start:start + chunk_size]
+            for start in range(0, len(encrypted_data), chunk_size)
+        ]
 
         LOGGER.verbose('Data chunks:', data_chunks)
 
@@ -470,29 +773,29 @@ class ReliableTransceiver:
             self.write_insecure(chunk)
 
     def receive(self, chunk_size: int = 140 - 14, timeout: float = 600.0, precision: float = 0.01) -> bytes:
-        start_time: float = time.time()
+        deadline: float = time.monotonic() + timeout
 
         while len(self.stream.input_buffer) < 12:
-            time.sleep(precision)
+            self.stream.wait_input(deadline - time.monotonic(), 12, precision)
 
-            if time.time() - start_time >= timeout:
+            if time.monotonic() >= deadline:
                 raise ConnectionAbortedError()
 
-        data = self.read_insecure(min(len(self.stream.input_buffer) - 1, chunk_size), timeout - time.time() + start_time)
+        data = self.read_insecure(min(len(self.stream.input_buffer) - 1, chunk_size), deadline - time.monotonic())
         if data:
             LOGGER.verbose('Received data:', data)
-        size = struct.unpack('<I', data[:4])[0]
+        size = self.LENGTH.unpack_from(data)[0]
         LOGGER.debug('Determined size of next data chunk:', size)
-        cipher_buffer: bytes = data[4:]
+        cipher_buffer: bytearray = bytearray(data[4:])
         left_size: int = size - len(cipher_buffer)
 
         while left_size > 0:
-            cipher_data: bytes = self.read_insecure(min(left_size, chunk_size), timeout - time.time() + start_time)
+            cipher_data: bytes = self.read_insecure(min(left_size, chunk_size), deadline - time.monotonic())
             cipher_buffer += cipher_data
             left_size -= len(cipher_data)
 
         LOGGER.verbose('Cipher buffer', cipher_buffer)
-        data: bytes = self.session_key.decrypt(cipher_buffer)
+        data: bytes = self.session_key.decrypt(bytes(cipher_buffer))
         LOGGER.verbose('Decrypted to:', data)
         return data
 
@@ -504,17 +807,16 @@ class ReliableTransceiver:
             self.last_received_packet = -1
             self.prev_packet_time = None
             self.first_packet_time = None
-            self.stream.turn_write()
 
             retries: int = 3
 
             while retries >= 0:
-                self.prev_packet_time = time.time()
+                self.prev_packet_time = time.monotonic()
                 self.stream.turn_write()
-                self.stream.write(struct.pack('<B', self.SYN))
+                self.stream.write(self.SYN_PACKET)
                 LOGGER.info('Sent `SYN`')
-                self.stream.turn_read()
 
+                # `read_insecure` switches the stream to reading itself.
                 try:
                     ack, data = self.read_insecure(1, abort_timeout=2.5, send_ack=False)
                 except ConnectionAbortedError:
@@ -524,7 +826,7 @@ class ReliableTransceiver:
 
                 assert isinstance(ack, bytes)
                 assert isinstance(data, bytes)
-                response: int = struct.unpack('<B', data)[0]
+                response: int = data[0]
 
                 if response != self.SYN | self.ACK:
                     LOGGER.warning('Another peer responded with something different than `SYN|ACK`:', response)
@@ -555,24 +857,24 @@ class ReliableTransceiver:
 
             buffer: bytes = self.stream.read(1)
 
-            if struct.unpack('<B', buffer)[0] != self.SYN:
+            if buffer[0] != self.SYN:
                 LOGGER.warning('Got value different from `SYN`')
                 continue
 
-            self.prev_packet_time = time.time()
+            self.prev_packet_time = time.monotonic()
             LOGGER.info('Received `SYN`, sending `SYN|ACK`...')
 
             retries: int = 3
             self.last_sent_packet += 1
-            syn_ack: bytes = struct.pack('<BB', self.last_sent_packet, self.SYN | self.ACK)
+            syn_ack: bytes = self.SYN_ACK_PACKETS[self.last_sent_packet]
 
             while retries >= 0:
                 self.stream.turn_write()
                 self.stream.write(syn_ack)
                 LOGGER.info('Sent `SYN|ACK`')
-                self.stream.turn_read()
 
-                if self.read_equals(reconnect_interval, struct.pack('<BB', self.last_sent_packet, self.ACK)):
+                # `read_equals` switches the stream to reading itself.
+                if self.read_equals(reconnect_interval, self.ACK_PACKETS[self.last_sent_packet]):
                     self.first_packet_time = self.prev_packet_time
                     self.stream.first_packet_time = self.first_packet_time
                     LOGGER.info('Received `ACK`')
@@ -601,7 +903,7 @@ class ReliableTransceiver:
         decrypted: bytes = self.session_key.decrypt(ech)
         assert decrypted == b'Hi'
 
-        ciphertext = self.session_key.encrypt(struct.pack('<B', self.ACK))
+        ciphertext = self.session_key.encrypt(bytes((self.ACK,)))
         LOGGER.verbose('Sending cipher: ', ciphertext)
         self.write_insecure(ciphertext)
 
@@ -633,7 +935,7 @@ class ReliableTransceiver:
 
         plaintext: bytes = self.session_key.decrypt(self.read_insecure(8 + 1))
         LOGGER.verbose('Should be ACK:', plaintext)
-        assert struct.unpack('<B', plaintext)[0] == self.ACK
+        assert plaintext[0] == self.ACK
 
         LOGGER.info('Connection established')
 
@@ -666,8 +968,10 @@ class ReliableTransceiver:
 def sender() -> None:
     if '--disable-log' in sys.argv:
         GGWave.disable_log()
-        LOGGER.log_tags = ['*I', '*W', '*E1']
-        LOGGER.traceback_tags = LOGGER.LOG_NOTHING
+        LOGGER.set_log_tags(
+            log_tags=['*I', '*W', '*E1'],
+            traceback_tags=LOGGER.LOG_NOTHING,
+        )
 
     LOGGER.add_global_prefix('Sender')
     stream: AlternativeStream = AlternativeStream(True)
@@ -689,8 +993,10 @@ def sender() -> None:
 def receiver() -> None:
     if '--disable-log' in sys.argv:
         GGWave.disable_log()
-        LOGGER.log_tags = ['*I', '*W', '*E1']
-        LOGGER.traceback_tags = LOGGER.LOG_NOTHING
+        LOGGER.set_log_tags(
+            log_tags=['*I', '*W', '*E1'],
+            traceback_tags=LOGGER.LOG_NOTHING,
+        )
 
     LOGGER.add_global_prefix('Receiver')
     stream: AlternativeStream = AlternativeStream(False)
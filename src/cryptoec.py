@@ -1,6 +1,8 @@
 import monocypher
 import struct
 
+from optional.chacha import chacha20
+
 
 # `PublicKey` and `SecretKey` are separate to make sure one won't be passed as another.
 class PublicKey:
@@ -33,6 +35,10 @@ class SecretKey:
 
 # Must only be used in one thread!
 class SymmetricKey:
+    # Nonce is a little-endian 64-bit message counter.
+    NONCE: struct.Struct = struct.Struct('<Q')
+    NONCE_MASK: int = (1 << 64) - 1
+
     # List is used here to pass that object by reference
     # so it can be securely wiped after its use.
     __symkey: list[bytes] | None
@@ -43,21 +49,20 @@ class SymmetricKey:
         self._nonce_counter = 0
 
     def next_nonce(self) -> bytes:
-        nonce: bytes = struct.pack('<Q', self._nonce_counter)
-        self._nonce_counter += 1
-        self._nonce_counter %= 256**8
+        nonce: bytes = self.NONCE.pack(self._nonce_counter)
+        self._nonce_counter = (self._nonce_counter + 1) & self.NONCE_MASK
         return nonce
 
     def encrypt(self, data: bytes) -> bytes:
         assert self.__symkey
         nonce: bytes = self.next_nonce()
-        return nonce + monocypher.chacha20(self.__symkey[0], nonce, data)
+        return nonce + chacha20(self.__symkey[0], nonce, data)
 
     def decrypt(self, data: bytes) -> bytes:
         assert self.__symkey
-        nonce: bytes = data[:8]
-        ciphertext: bytes = data[8:]
-        return monocypher.chacha20(self.__symkey[0], nonce, ciphertext)
+        nonce: bytes = data[:self.NONCE.size]
+        ciphertext: bytes = data[self.NONCE.size:]
+        return chacha20(self.__symkey[0], nonce, ciphertext)
 
     def dispose(self) -> None:
         assert self.__symkey
@@ -11,43 +11,282 @@ to connect to other peer.
 """
 
 from collections.abc import Generator
-import reedsolo  # type: ignore
+
+import numpy as np
+from numpy.typing import NDArray
+
+from optional.jit import jit_disabled, njit
+from optional.reedsolomon import RSCodec, ReedSolomonError, creedsolo_disabled
 
 EC_BLOCK_SIZE = 136
 REDUNDANCY_SIZE = 6
 
+# GF(2^8) tables with the same primitive polynomial and generator as
+# `reedsolo.RSCodec` uses by default. `GF_EXP` is doubled so sum of two
+# logarithms never has to be reduced.
+GF_PRIMITIVE = 0x11d
+GF_EXP: NDArray[np.uint8] = np.zeros(512, dtype=np.uint8)
+GF_LOG: NDArray[np.int32] = np.zeros(256, dtype=np.int32)
+
+
+def _init_gf_tables() -> None:
+    x: int = 1
+
+    for i in range(255):
+        GF_EXP[i] = x
+        GF_LOG[x] = i
+        x <<= 1
+
+        if x & 0x100:
+            x ^= GF_PRIMITIVE
+
+    GF_EXP[255:510] = GF_EXP[:255]
+
+
+def _generator_poly(nsym: int) -> NDArray[np.uint8]:
+    generator: list[int] = [1]
+
+    for i in range(nsym):
+        # Multiply by (x - 2^i), subtraction in GF(2^8) is XOR.
+        root: int = int(GF_EXP[i])
+        product: list[int] = generator + [0]
+
+        for j, coef in enumerate(generator):
+            if coef != 0:
+                product[j + 1] ^= int(GF_EXP[GF_LOG[coef] + GF_LOG[root]])
+
+        generator = product
+
+    return np.array(generator, dtype=np.uint8)
+
+
+def _mul_table(factors: NDArray[np.uint8]) -> NDArray[np.uint8]:
+    """
+    Returns table whose row `i` holds products of `factors[i]` and every byte,
+    so GF(2^8) multiplication by a known factor is a single lookup.
+    """
+    table: NDArray[np.uint8] = np.zeros((len(factors), 256), dtype=np.uint8)
+    byte_logs: NDArray[np.int32] = GF_LOG[1:]
+
+    for i, factor in enumerate(factors):
+        if factor != 0:
+            table[i, 1:] = GF_EXP[byte_logs + GF_LOG[factor]]
+
+    return table
+
+
+_init_gf_tables()
+GENERATOR_POLY: NDArray[np.uint8] = _generator_poly(REDUNDANCY_SIZE)
+# Row `x` holds products of `x` and every generator coefficient except the
+# leading one, so one encoding step XORs a whole row into parity bytes.
+GENERATOR_MUL: NDArray[np.uint8] = np.ascontiguousarray(_mul_table(GENERATOR_POLY[1:]).T)
+# Row `i` holds products of every byte and `i`-th root of generator.
+SYNDROME_MUL: NDArray[np.uint8] = _mul_table(GF_EXP[:REDUNDANCY_SIZE])
+
+
+@njit(cache=True, boundscheck=False)
+def _rs_encode_block(
+    block: NDArray[np.uint8],
+    generator_mul: NDArray[np.uint8],
+    out: NDArray[np.uint8],
+) -> None:
+    """
+    Writes `block` followed by its Reed-Solomon parity bytes into `out`.
+    """
+    size: int = len(block)
+    nsym: int = generator_mul.shape[1]
+    out[:size] = block
+    out[size:] = 0
+
+    for i in range(size):
+        coef = out[i]
+
+        if coef == 0:
+            continue
+
+        products = generator_mul[coef]
+
+        for j in range(nsym):
+            out[i + 1 + j] ^= products[j]
+
+    out[:size] = block
+
+
+@njit(cache=True, boundscheck=False)
+def _rs_has_errors(
+    block: NDArray[np.uint8],
+    syndrome_mul: NDArray[np.uint8],
+) -> bool:
+    """
+    Returns whether any syndrome of encoded `block` is non-zero.
+    """
+    for i in range(syndrome_mul.shape[0]):
+        products = syndrome_mul[i]
+        value = 0
+
+        for byte in block:
+            value = products[value] ^ byte
+
+        if value != 0:
+            return True
+
+    return False
+
+
+@njit(cache=True, boundscheck=False)
+def _rs_encode_blocks(
+    data: NDArray[np.uint8],
+    block_size: int,
+    generator_mul: NDArray[np.uint8],
+    out: NDArray[np.uint8],
+) -> None:
+    """
+    Encodes every `block_size` bytes of `data` into `out`, so the whole packet
+    is handled by a single compiled call.
+    """
+    nsym: int = generator_mul.shape[1]
+    blocks: int = -(-len(data) // block_size)
+
+    for i in range(blocks):
+        block = data[i * block_size:(i + 1) * block_size]
+        start: int = i * (block_size + nsym)
+        _rs_encode_block(block, generator_mul, out[start:start + len(block) + nsym])
+
+
+@njit(cache=True, boundscheck=False)
+def _rs_blocks_have_errors(
+    data: NDArray[np.uint8],
+    encoded_block_size: int,
+    syndrome_mul: NDArray[np.uint8],
+) -> bool:
+    """
+    Returns whether any of encoded blocks in `data` is too short or has
+    errors.
+    """
+    nsym: int = syndrome_mul.shape[0]
+
+    for start in range(0, len(data), encoded_block_size):
+        block = data[start:start + encoded_block_size]
+
+        if len(block) <= nsym or _rs_has_errors(block, syndrome_mul):
+            return True
+
+    return False
+
 
 class ErrorCorrector:
     """
     Data to be error-corrected. Can encode/decode.
+
+    Reed-Solomon codec is shared between all instances, so it is only built
+    once. Single instance may also be reused for different data with
+    `encode_bytes()` and `decode_bytes()`.
+
+    Codec is not modified by encoding or decoding (`reedsolo` only restores
+    its own tables before each call), so the same instance is used by writer
+    and reader threads at once.
     """
 
     data: bytes
-    rscodec: reedsolo.RSCodec
+    rscodec: RSCodec
+
+    _shared_rscodec: RSCodec | None = None
+    # Compiled `creedsolo` is as fast as JIT kernels and also corrects errors,
+    # so they are only used with pure-Python `reedsolo`.
+    _use_jit: bool = creedsolo_disabled and not jit_disabled
 
-    def __init__(self, data: bytes):
+    def __init__(self, data: bytes = b''):
         self.data = data
-        self.rscodec = reedsolo.RSCodec(
-            REDUNDANCY_SIZE,
-            EC_BLOCK_SIZE + REDUNDANCY_SIZE,
-        )
+        self.rscodec = self._get_rscodec()
+
+    @classmethod
+    def _get_rscodec(cls) -> RSCodec:
+        if cls._shared_rscodec is None:
+            cls._shared_rscodec = RSCodec(
+                REDUNDANCY_SIZE,
+                EC_BLOCK_SIZE + REDUNDANCY_SIZE,
+            )
+
+        return cls._shared_rscodec
+
+    @classmethod
+    def warm_up(cls) -> None:
+        """
+        Compiles JIT kernels (or loads them from cache) in advance, so first
+        packet is not delayed by it.
+        """
+        if cls._use_jit:
+            cls._strip_if_valid_jit(cls._encode_jit(bytes(EC_BLOCK_SIZE)))
 
     def encode(self) -> bytes:
+        return self.encode_bytes(self.data)
+
+    def decode(self) -> bytes:
+        return self.decode_bytes(self.data)
+
+    def encode_bytes(self, data: bytes) -> bytes:
+        if self._use_jit:
+            return self._encode_jit(data)
+
         # Encode the data (adds redundancy)
-        encoded_data = self.rscodec.encode(self.data)
+        encoded_data = self.rscodec.encode(data)
         return bytes(encoded_data)
 
-    def decode(self) -> bytes:
+    @staticmethod
+    def _encode_jit(data: bytes) -> bytes:
+        blocks: int = -(-len(data) // EC_BLOCK_SIZE)
+        result = np.empty(len(data) + blocks * REDUNDANCY_SIZE, dtype=np.uint8)
+        _rs_encode_blocks(
+            np.frombuffer(data, dtype=np.uint8),
+            EC_BLOCK_SIZE,
+            GENERATOR_MUL,
+            result,
+        )
+        return result.tobytes()
+
+    @staticmethod
+    def _strip_if_valid_jit(data: bytes) -> bytes | None:
+        """
+        Returns `data` without parity bytes if it has no errors, otherwise
+        returns `None`.
+        """
+        encoded_block_size: int = EC_BLOCK_SIZE + REDUNDANCY_SIZE
+
+        if _rs_blocks_have_errors(
+            np.frombuffer(data, dtype=np.uint8),
+            encoded_block_size,
+            SYNDROME_MUL,
+        ):
+            return None
+
+        return b''.join(
+            data[start:min(start + encoded_block_size, len(data)) - REDUNDANCY_SIZE]
+            for start in range(0, len(data), encoded_block_size)
+        )
+
+    def decode_bytes(self, data: bytes) -> bytes:
+        if self._use_jit:
+            # Most of the packets have no errors, they don't need to go
+            # through full decoding.
+            decoded: bytes | None = self._strip_if_valid_jit(data)
+
+            if decoded is not None:
+                return decoded
+
         try:
             # Decode the data (corrects errors using redundancy)
-            decoded_data, _, _ = self.rscodec.decode(self.data)
+            decoded_data, _, _ = self.rscodec.decode(data)
             return bytes(decoded_data)
-        except reedsolo.ReedSolomonError as e:
+        except ReedSolomonError as e:
             # If too many errors to correct
             raise ValueError(f"Unable to decode: {str(e)}") from e
 
     @staticmethod
     def break_into_frames(packet: bytes) -> Generator[bytes]:
-        while packet:
-            yield packet[:EC_BLOCK_SIZE - REDUNDANCY_SIZE]
-            packet = packet[EC_BLOCK_SIZE - REDUNDANCY_SIZE:]
+        # Frames are sliced by offset, so the rest of the packet is not copied
+        # after every frame.
+        view: memoryview = memoryview(packet)
+        step: int = EC_BLOCK_SIZE - REDUNDANCY_SIZE
+
+        for start in range(0, len(view), step):
+            yield bytes(view[start:start + step])
@@ -2,14 +2,11 @@
 Module which gets and processes input from the microphone.
 """
 
-import struct
-
+from collections import deque
 from math import ceil
-from threading import Thread
-from time import sleep
-from typing import Any
+from typing import Any, Callable
 from numpy.typing import NDArray
-from pyaudio import PyAudio, Stream, paInt16
+from pyaudio import PyAudio, Stream, paContinue, paInputOverflow, paInt16
 
 import numpy as np
 import pyfftw
@@ -26,6 +23,9 @@ class SoundListenerSync:
     """
 
     DEFAULT_SAMPLING_RATE: int = 48000
+    # Maximum amount of frames kept in `available_frames`. If they are not
+    # popped in time, the oldest ones are discarded.
+    MAX_AVAILABLE_FRAMES: int = 256
 
     audio: PyAudio
     input_stream: Stream
@@ -34,12 +34,17 @@ class SoundListenerSync:
     frames_per_buffer: int
     is_listening: bool
     duration: float
-    available_frames: list[bytes]
+    available_frames: deque[bytes]
 
     def __init__(self,
                  sampling_rate: int = DEFAULT_SAMPLING_RATE,
                  frames_per_buffer: int = 1024,
-                 duration: float = 0.25) -> None:
+                 duration: float = 0.25,
+                 stream_callback: Callable[..., Any] | None = None) -> None:
+        """
+        If `stream_callback` is specified, input stream is opened in
+        callback mode and `process()` must not be used.
+        """
         self.audio = PyAudio()
         self.sampling_rate = sampling_rate
         self.frames_per_buffer = frames_per_buffer
@@ -50,9 +55,10 @@ class SoundListenerSync:
             rate=self.sampling_rate,
             frames_per_buffer=self.frames_per_buffer,
             input=True,
+            stream_callback=stream_callback,
         )
         self.is_listening = False
-        self.available_frames = []
+        self.available_frames = deque(maxlen=self.MAX_AVAILABLE_FRAMES)
 
     def listen(self) -> None:
         """
@@ -73,12 +79,15 @@ class SoundListenerSync:
         Reads batch of data from the microphone.
         Size of that batch is determined by `self.frames_per_buffer`.
         """
-        for _i in range(0, ceil(
-            self.sampling_rate /
-            self.frames_per_buffer * self.duration
-        )):
-            data: bytes = self.input_stream.read(self.frames_per_buffer)
-            self.available_frames.append(data)
+        read: Callable[[int], bytes] = self.input_stream.read
+        frames_per_buffer: int = self.frames_per_buffer
+        self.available_frames.extend(
+            read(frames_per_buffer)
+            for _i in range(ceil(
+                self.sampling_rate /
+                frames_per_buffer * self.duration
+            ))
+        )
 
     def cleanup(self) -> None:
         """
@@ -93,34 +102,38 @@ class SoundListenerSync:
 
 class SoundListener:
     """
-    Wrapper around `SoundListenerSync` in another thread.
+    Wrapper around `SoundListenerSync` which is fed by PortAudio in its own
+    thread.
+
+    Input stream runs in callback mode, so every captured buffer is handed
+    over as soon as it is available without polling it from Python.
     """
 
     sync_listener: SoundListenerSync
-    sound_thread: Thread
-    is_disposing: bool
 
     def __init__(self, **kwargs: Any) -> None:
-        self.sync_listener = SoundListenerSync(**kwargs)
-        self.sound_thread = Thread(target=self._sound_loop)
-        self.is_disposing = False
-
-        self.sound_thread.start()
+        self.sync_listener = SoundListenerSync(
+            stream_callback=self._stream_callback,
+            **kwargs,
+        )
 
     def _cleanup(self) -> None:
         self.sync_listener.cleanup()
 
-    def _sound_loop(self) -> None:
-        while not self.is_disposing:
-            if self.sync_listener.is_listening:
-                try:
-                    self.sync_listener.process()
-                except OSError as exc:
-                    LOGGER.error3(exc)
+    def _stream_callback(
+        self,
+        in_data: bytes | None,
+        _frame_count: int,
+        _time_info: Any,
+        status_flags: int,
+    ) -> tuple[None, int]:
+        if status_flags & paInputOverflow:
+            LOGGER.error3('Input overflowed')
 
-            sleep(0.001)
+        if in_data is not None and self.sync_listener.is_listening:
+            self.sync_listener.available_frames.append(in_data)
 
-        self._cleanup()
+        return (None, paContinue)
 
     def listen(self) -> None:
         """
@@ -129,35 +142,56 @@ class SoundListener:
         """
         self.sync_listener.is_listening = True
 
-    def dispose(self, **kwargs: Any) -> None:
+    def dispose(self, **_kwargs: Any) -> None:
         """
         Cleans up resources after using that listener.
 
         After calling `dispose()`, the listener should not be used anymore.
         """
-        self.is_disposing = True
-        self.sound_thread.join(**kwargs)
+        self._cleanup()
 
     def pop_available_frames(self) -> list[bytes]:
         """
         Returns all available frames at the current moment of time.
         It also clears a list with all available frames.
         """
-        frames: list[bytes] = self.sync_listener.available_frames
-        self.sync_listener.available_frames = []
-        return frames
+        available_frames: deque[bytes] = self.sync_listener.available_frames
+        # Only as many frames as were available are popped, so frames appended
+        # by the stream callback meanwhile are left for the next call.
+        return [available_frames.popleft() for _i in range(len(available_frames))]
 
 
-def fourie_transform(data: bytes) -> NDArray[Any]:
+# Planned FFTW transforms keyed by input length.
+_FFT_PLANS: dict[int, Any] = {}
+
+
+def _rfft_plan(size: int) -> Any:
     """
-    Performs fast Fourie transform on given microphone input `data`.
+    Returns FFTW plan of real FFT for input of given `size`.
+
+    Planning is expensive, so plans are created once and reused afterwards.
     """
-    data2 = np.array(
-        struct.unpack(f'{len(data) // 2}h', data),
-        dtype=np.int16
-    )
-    fft_result: Any = pyfftw.builders.fft(data2)()
-    split_data = np.split(np.abs(fft_result), 2)
-    fft = np.add(split_data[0], split_data[1][::-1])
-    return fft
+    plan: Any = _FFT_PLANS.get(size)
+
+    if plan is None:
+        plan = pyfftw.builders.rfft(
+            pyfftw.empty_aligned(size, dtype=np.float32),
+        )
+        _FFT_PLANS[size] = plan
 
+    return plan
+
+
+def fourie_transform(data: bytes, dtype: type[np.number] = np.int16) -> NDArray[Any]:
+    """
+    Performs fast Fourie transform on given microphone input `data` which
+    consists of `dtype` samples.
+    """
+    data2 = np.frombuffer(data, dtype=dtype)
+    fft_result: Any = _rfft_plan(len(data2))(data2)
+    magnitudes: NDArray[Any] = np.abs(fft_result)
+    # Input is real, so only the non-redundant half of the spectrum is
+    # computed. Folding the full spectrum in half added magnitudes of bins `k`
+    # and `N - 1 - k`, which is the same as bins `k` and `k + 1`, so the
+    # result keeps that layout and scale (`N / 2` bins).
+    return magnitudes[:-1] + magnitudes[1:]
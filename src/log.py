@@ -1,4 +1,7 @@
 from os import stat
+from types import FrameType
+from typing import TextIO
+import atexit
 import sys
 import time
 import os.path as opath
@@ -7,6 +10,27 @@ import traceback
 import pyggwave
 
 
+class _TagInfo:
+    """
+    Everything `Logger` needs to know about a single tag.
+    """
+
+    __slots__ = ('enabled', 'log_time', 'traceback', 'log_file', 'log_stdout',
+                 'log_stderr', 'name', 'color')
+
+    # Whether tag is matched by `log_tags`, `log_time_tags`,
+    # `traceback_tags`, `log_file_tags`, `log_stdout_tags` and
+    # `log_stderr_tags` respectively.
+    enabled: bool
+    log_time: bool
+    traceback: bool
+    log_file: bool
+    log_stdout: bool
+    log_stderr: bool
+    name: str
+    color: str
+
+
 class Logger:
     TAG_NAMES: dict[str, str] = {
         '*E3': 'Third-party error',
@@ -45,6 +69,7 @@ class Logger:
     LOG_EVERYTHING: list[str] = ['*']
     LOG_NOTHING: list[str] = []
     DEFAULT_TRACEBACK_TAGS: list[str] = ['*E1', '*W', '*Vw']
+    LOG_FILE_PATH: str = opath.join(opath.dirname(opath.dirname(opath.realpath(__file__))), 'log.txt')
 
     log_tags: list[str]
     log_time_tags: list[str]
@@ -53,8 +78,12 @@ class Logger:
     log_stderr_tags: list[str]
     traceback_tags: list[str]
     global_prefixes: list[str]
+    # Filled lazily, cleared by `set_log_tags()`.
+    _tag_cache: dict[str, _TagInfo]
     use_colors: bool
     init_time: str | None = None
+    # Opened on the first write to the log file and kept open afterwards.
+    _log_file: TextIO | None = None
 
     def __init__(
             self,
@@ -67,6 +96,7 @@ class Logger:
             global_prefixes: list[str] = [],
             use_colors: bool = True,
     ) -> None:
+        self._tag_cache = {}
         self.log_tags = log_tags
         self.log_time_tags = log_time_tags
         self.log_file_tags = log_file_tags
@@ -77,6 +107,59 @@ class Logger:
         self.use_colors = use_colors
         self.init_time = self._current_time()
 
+    def set_log_tags(
+            self,
+            log_tags: list[str] | None = None,
+            log_time_tags: list[str] | None = None,
+            log_file_tags: list[str] | None = None,
+            log_stdout_tags: list[str] | None = None,
+            log_stderr_tags: list[str] | None = None,
+            traceback_tags: list[str] | None = None,
+    ) -> None:
+        """
+        Replaces given tag lists and forgets what was cached about tags.
+
+        Tag lists which are changed in place are only taken into account after
+        this method is called, it can be called without arguments for that.
+        """
+
+        if log_tags is not None:
+            self.log_tags = log_tags
+
+        if log_time_tags is not None:
+            self.log_time_tags = log_time_tags
+
+        if log_file_tags is not None:
+            self.log_file_tags = log_file_tags
+
+        if log_stdout_tags is not None:
+            self.log_stdout_tags = log_stdout_tags
+
+        if log_stderr_tags is not None:
+            self.log_stderr_tags = log_stderr_tags
+
+        if traceback_tags is not None:
+            self.traceback_tags = traceback_tags
+
+        self._tag_cache = {}
+
+    def _tag_info(self, tag: str) -> _TagInfo:
+        info: _TagInfo | None = self._tag_cache.get(tag)
+
+        if info is None:
+            info = _TagInfo()
+            info.enabled = self._tag_matches(tag, self.log_tags)
+            info.log_time = self._tag_matches(tag, self.log_time_tags)
+            info.traceback = self._tag_matches(tag, self.traceback_tags)
+            info.log_file = self._tag_matches(tag, self.log_file_tags)
+            info.log_stdout = self._tag_matches(tag, self.log_stdout_tags)
+            info.log_stderr = self._tag_matches(tag, self.log_stderr_tags)
+            info.name = self._tag_get(tag, self.TAG_NAMES)
+            info.color = self._tag_get(tag, self.COLORS)
+            self._tag_cache[tag] = info
+
+        return info
+
     @staticmethod
     def _tag_get(tag: str, tag_list: dict[str, str]) -> str:
         for i in reversed(range(len(tag) + 1)):
@@ -97,7 +180,14 @@ class Logger:
         if not (self.use_colors or force_use_colors):
             return data
 
-        return f'{self._tag_get(tag, self.COLORS)}{data}{self.RESET_COLOR}'
+        return f'{self._tag_info(tag).color}{data}{self.RESET_COLOR}'
+
+    def _get_log_file(self) -> TextIO:
+        if self._log_file is None:
+            self._log_file = open(self.LOG_FILE_PATH, 'a')
+            atexit.register(self._log_file.close)
+
+        return self._log_file
 
     def _log(
             self,
@@ -108,31 +198,28 @@ class Logger:
             force_log_stderr: bool | None = None,
             force_use_colors: bool | None = None,
     ) -> None:
-        if self._tag_matches(tag, self.log_file_tags) if force_log_file is None else force_log_file:
-            with open(opath.join(opath.dirname(opath.dirname(opath.realpath(__file__))), 'log.txt'), 'a') as file:
-                if self.init_time is not None:
-                    file.write(f'\n=== Logger initializated at {self.init_time} ===\n')
-                    self.init_time = None
+        info: _TagInfo = self._tag_info(tag)
+
+        if info.log_file if force_log_file is None else force_log_file:
+            file: TextIO = self._get_log_file()
 
-                file.write(f'{data}')
-                file.flush()
+            if self.init_time is not None:
+                file.write(f'\n=== Logger initializated at {self.init_time} ===\n')
+                self.init_time = None
 
-        if self._tag_matches(tag, self.log_stdout_tags) if force_log_stdout is None else force_log_stdout:
+            file.write(data)
+            file.flush()
+
+        if info.log_stdout if force_log_stdout is None else force_log_stdout:
             print(self._colorize(tag, data, force_use_colors), end='', flush=True)
 
-        if self._tag_matches(tag, self.log_stderr_tags) if force_log_stderr is None else force_log_stderr:
+        if info.log_stderr if force_log_stderr is None else force_log_stderr:
             print(self._colorize(tag, data, force_use_colors), end='', file=sys.stderr, flush=True)
 
     @staticmethod
     def _current_time() -> str:
         return str(datetime.now())
 
-    def _global_prefixes(self) -> str:
-        if len(self.global_prefixes) == 0:
-            return ''
-
-        return f'{' '.join(self.global_prefixes)} '
-
     def add_global_prefix(self, prefix: str) -> bool:
         if prefix in self.global_prefixes:
             return False
@@ -154,19 +241,56 @@ class Logger:
             sep: str = ' ',
             end: str = '\n',
             force_log_time: bool | None = None,
+            full_traceback: bool = False,
             **kwargs,
     ) -> None:
-        if not self._tag_matches(tag, self.log_tags):
+        """
+        Tracebacks of tags in `traceback_tags` only list frames. If
+        `full_traceback` is `True`, source lines are read and added as well.
+        """
+        # Checked before anything is formatted, so disabled tags cost only a
+        # dictionary lookup.
+        info: _TagInfo = self._tag_info(tag)
+
+        if not info.enabled:
             return
 
-        log_time: bool = self._tag_matches(tag, self.log_time_tags) if force_log_time is None else force_log_time
-        text: str = sep.join([str(x) for x in args]) + end
-        data: str = f'{f'{self._current_time()} ' if log_time else ''}{self._global_prefixes()}[{self._tag_get(tag, self.TAG_NAMES)}] {text}'
+        log_time: bool = info.log_time if force_log_time is None else force_log_time
+
+        text: str
+
+        # Most of the calls pass a single message string.
+        if len(args) == 1 and type(args[0]) is str:
+            text = args[0] + end
+        else:
+            text = sep.join(map(str, args)) + end
+
+        prefix: str = f'{' '.join(self.global_prefixes)} ' if self.global_prefixes else ''
+        data: str
+
+        # Each branch builds the line with a single f-string.
+        if log_time:
+            data = f'{self._current_time()} {prefix}[{info.name}] {text}'
+        else:
+            data = f'{prefix}[{info.name}] {text}'
+
+        if info.traceback:
+            if full_traceback:
+                for element in traceback.format_stack()[:-2]:
+                    for line in element.splitlines(True):
+                        data += f'  {line}'
+            else:
+                # Frames are walked directly, `traceback` would also read
+                # source files to show their lines.
+                frames: list[str] = []
+                frame: FrameType | None = sys._getframe(2)
+
+                while frame is not None:
+                    frames.append(f'    File "{frame.f_code.co_filename}", line {frame.f_lineno}, in {frame.f_code.co_name}\n')
+                    frame = frame.f_back
 
-        if self._tag_matches(tag, self.traceback_tags):
-            for element in traceback.format_stack()[:-2]:
-                for line in element.splitlines(True):
-                    data += f'  {line}'
+                frames.reverse()
+                data += ''.join(frames)
 
         self._log(tag, data, **kwargs)
 
@@ -225,15 +349,15 @@ class Logger:
         self.log('f', *args, **kwargs)
 
     def is_logging_slow(self) -> bool:
-        return self._tag_matches('f', self.log_tags)
+        return self._tag_info('f').enabled
 
     def enable_all(self) -> None:
         pyggwave.GGWave.enable_log()
-        self.log_tags = self.LOG_EVERYTHING
+        self.set_log_tags(self.LOG_EVERYTHING)
 
     def disable_all(self) -> None:
         pyggwave.GGWave.disable_log()
-        self.log_tags = self.LOG_NOTHING
+        self.set_log_tags(self.LOG_NOTHING)
 
 
 # LOGGER: Logger = Logger(
@@ -64,7 +64,7 @@ class SoundSender:
         self.freq = Freq(channel_id)
         self.skip_frames = skip_frames
         self.prev_batch_time = None
-        self.cumulative_input = bytes()
+        self.cumulative_input = b''
 
     def initialize_communication(self) -> None:
         """
@@ -138,12 +138,12 @@ class SoundSender:
         self.batch.wait()
         LOGGER.info('Message sent')
 
-    def _nearest(self, array: list[float], value: float) -> float:
+    def _nearest_index(self, array: NDArray[Any], value: float) -> int:
         """
-        Returns a value of an element in the `array` which is the nearest to
+        Returns an index of an element in the `array` which is the nearest to
         `value`.
         """
-        return min(array, key=lambda x: abs(x - value))
+        return int(np.abs(array - value).argmin())
 
     def _freq_plusminus(self, base_freq: float, plusminus: float
                         ) -> tuple[float, float]:
@@ -156,10 +156,10 @@ class SoundSender:
             self,
             freq_step: float,
             frequencies: list[float],
-            x_values: list[float],
-            values: list[np.float64],
+            x_values: NDArray[Any],
+            values: list[np.float32],
             fft: NDArray[Any],
-    ) -> list[np.float64]:
+    ) -> list[np.float32]:
         """
         Returns difference between every element of `values` and environmental
         noise.
@@ -167,7 +167,7 @@ class SoundSender:
         @param freq_step: Difference between two nearest data bit frequencies
         in the channel.
         @param frequencies: List of original frequencies to reduce noise from.
-        @param x_values: List of real frequencies on FFT.
+        @param x_values: Array of real frequencies on FFT.
         @param values: List of FFT values nearest on `frequencies` list.
         @param fft: List of original FFT values on `x_values` as frequency
         list.
@@ -182,18 +182,18 @@ class SoundSender:
 
         for freq_pair in off_frequencies:
             nearest_off_freqs.append((
-                x_values.index(self._nearest(x_values, freq_pair[0])),
-                x_values.index(self._nearest(x_values, freq_pair[1])),
+                self._nearest_index(x_values, freq_pair[0]),
+                self._nearest_index(x_values, freq_pair[1]),
             ))
 
-        noise_values: list[tuple[np.float64, np.float64]] = [
+        noise_values: list[tuple[np.float32, np.float32]] = [
             (fft[x[0]], fft[x[1]]) for x in nearest_off_freqs]
-        avg_noise: list[np.float64] = [
+        avg_noise: list[np.float32] = [
             (x[0] + x[1]) / 2.0 for x in noise_values]
 
         assert len(values) == len(avg_noise)
 
-        reduced_noise_values: list[np.float64] = [
+        reduced_noise_values: list[np.float32] = [
             values[i] - avg_noise[i] for i in range(len(values))
         ]
 
@@ -246,10 +246,9 @@ class SoundSender:
         nearest_freqs: list[int] = []
 
         for freq in frequencies:
-            nearest_freqs.append(x_values.index(self._nearest(
-                x_values, freq)))
+            nearest_freqs.append(self._nearest_index(x_values, freq))
 
-        values: list[np.float64] = [fft[x] for x in nearest_freqs]
+        values: list[np.float32] = [fft[x] for x in nearest_freqs]
 
         # FIXME: NOISE REDUCTION IS INSECURE!!!
         # UNDER RIGHT CIRCUMSTANCES ATTACKER CAN REWRITE ANY MESSAGE TO
@@ -326,7 +325,7 @@ class SoundSender:
         self.prev_batch_time += duration
 
         fft = fourie_transform(self.cumulative_input)
-        self.cumulative_input = bytes()
+        self.cumulative_input = b''
         set_bits = self._get_set_bits(
             fft,
             frequencies,
@@ -378,20 +377,19 @@ class SoundSender:
         while True:
             frames: list[bytes] = self.listener.pop_available_frames()
 
-            while len(frames) > 0:
-                frame: bytes
+            if len(frames) > 10 and self.skip_frames:
+                frames = frames[-1:]
+                LOGGER.warning('Skipping frames to speed up')
 
-                if len(frames) > 10 and self.skip_frames:
-                    frame = frames.pop()
-                    frames.clear()
-                    LOGGER.warning('Skipping frames to speed up')
-                else:
-                    frame = frames.pop(0)
+            # Frames are iterated in place, popping them from the front of the
+            # list would shift the rest of it every time.
+            last_index: int = len(frames) - 1
 
+            for index, frame in enumerate(frames):
                 if self.prev_batch_time is None:
                     fft = fourie_transform(frame)
 
-                    if len(frames) == 0:
+                    if index == last_index:
                         self.visualizer.process(fft)
                         self.visualizer.process_bits(
                             self._get_set_bits(
@@ -0,0 +1,40 @@
+"""
+Module which provides the fastest available ChaCha20 implementation.
+
+`cryptography` uses OpenSSL's ChaCha20, which processes several blocks at
+once with SIMD instructions picked at runtime. If it is not available then
+`monocypher` is used for every message.
+
+Both produce the same keystream: IETF nonce of OpenSSL starts with 32-bit
+block counter, so original 64-bit ChaCha20 nonce of monocypher is prefixed with
+zeroed counter and zeroed upper half of it.
+"""
+
+import monocypher
+
+cryptography_disabled: bool = False
+
+try:
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms  # type: ignore
+except ImportError:
+    cryptography_disabled = True
+
+# Setting up OpenSSL cipher costs more than encrypting short messages with
+# monocypher, so only messages of at least that size use it.
+VECTORIZED_MIN_SIZE: int = 256
+_ZERO_COUNTER: bytes = bytes(8)
+
+
+def chacha20(key: bytes, nonce: bytes, data: bytes) -> bytes:
+    """
+    Same as `monocypher.chacha20(key, nonce, data)` but uses OpenSSL for long
+    messages if it is available.
+    """
+
+    if cryptography_disabled or len(data) < VECTORIZED_MIN_SIZE:
+        return monocypher.chacha20(key, nonce, data)
+
+    return Cipher(algorithms.ChaCha20(key, _ZERO_COUNTER + nonce), None).encryptor().update(data)
+
+
+__all__ = ['chacha20', 'cryptography_disabled']
@@ -0,0 +1,31 @@
+"""
+Module which is used for JIT compilation of numeric hot loops.
+
+If `numba` is not available then decorated functions are left as is, so
+callers should check `jit_disabled` and prefer vectorized implementations in
+that case.
+"""
+
+from typing import Any, Callable
+
+jit_disabled: bool = False
+
+try:
+    import numba
+except ImportError:
+    jit_disabled = True
+
+
+def njit(*args: Any, **kwargs: Any) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Same as `numba.njit(*args, **kwargs)` but does nothing if `numba` is not
+    available.
+    """
+
+    if jit_disabled:
+        return lambda func: func
+
+    return numba.njit(*args, **kwargs)
+
+
+prange: Callable[..., Any] = range if jit_disabled else numba.prange
@@ -0,0 +1,17 @@
+"""
+Module which provides the fastest available Reed-Solomon codec.
+
+`creedsolo` is the Cython build of `reedsolo` (it is compiled when `reedsolo`
+is installed with `--cythonize`) and has the same API. If it is not available
+then pure-Python `reedsolo` is used.
+"""
+
+creedsolo_disabled: bool = False
+
+try:
+    from creedsolo import RSCodec, ReedSolomonError  # type: ignore
+except ImportError:
+    creedsolo_disabled = True
+    from reedsolo import RSCodec, ReedSolomonError  # type: ignore
+
+__all__ = ['RSCodec', 'ReedSolomonError', 'creedsolo_disabled']
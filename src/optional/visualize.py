@@ -7,6 +7,7 @@ It is not an essential part of the whole project but helps to detect bugs.
 import sys
 from typing import Any
 
+import numpy as np
 from numpy.typing import NDArray
 
 from soundcom.audioconsts import Freq
@@ -24,49 +25,130 @@ class Visualizer:
     Class for general visualizations using `matplotlib`.
     """
 
-    X_VALUES_MEMO: dict[int, list[float]] = {}
+    X_VALUES_MEMO: dict[tuple[int, float], NDArray[np.float32]] = {}
+    # Amount of bins FFT result is reduced to before plotting it.
+    SPECTRUM_BINS: int = 128
 
+    # Headroom which is added above the highest value when axes are rescaled.
+    Y_HEADROOM: float = 1.2
+
+    figure: Any = None
+    axes: Any = None
+    background: Any = None
     main_graph: Any = None
-    freq_marks: list[Any] = []
+    freq_marks: list[Any]
 
     plt_initialized: bool = False
     sampling_rate: int
 
     def __init__(self, sampling_rate: int) -> None:
         self.sampling_rate = sampling_rate
+        self.freq_marks = []
+
+    def _init_plot(self) -> None:
+        """
+        Creates figure with persistent artists which are updated on every
+        frame instead of being replotted.
+        """
+        self.figure, self.axes = plt.subplots()
+        self.main_graph = self.axes.plot(
+            [],
+            [],
+            color=(0, 0, 1),
+            animated=True,
+        )[0]
+        self.axes.set_ylim(0.0, 1.0)
+        plt.show(block=False)
+        plt.pause(0.001)
+        self._redraw()
+        self.plt_initialized = True
+
+    def _redraw(self) -> None:
+        """
+        Fully redraws figure and saves its background for blitting.
+
+        Should only be called when static parts of the figure have changed.
+        """
+        self.figure.canvas.draw()
+        self.background = self.figure.canvas.copy_from_bbox(self.axes.bbox)
+
+    def _fit_y(self, value: float) -> bool:
+        """
+        Extends Y axis so `value` is visible.
+
+        Returns whether axes were changed.
+        """
+        if value <= self.axes.get_ylim()[1]:
+            return False
+
+        self.axes.set_ylim(0.0, value * self.Y_HEADROOM)
+        return True
+
+    def _blit(self) -> None:
+        canvas: Any = self.figure.canvas
+        canvas.restore_region(self.background)
+        self.axes.draw_artist(self.main_graph)
+
+        for mark in self.freq_marks:
+            self.axes.draw_artist(mark)
+
+        canvas.blit(self.axes.bbox)
+        canvas.flush_events()
 
     def _cut_frequencies(
         self,
-        x_values: list[float],
+        x_values: NDArray[Any],
         values: NDArray[Any],
         cutoff_frequency: float,
-    ) -> tuple[list[float], NDArray[Any]]:
-        min_index: int = 0
-
-        for i, freq in enumerate(x_values):
-            if freq > cutoff_frequency:
-                break
+    ) -> tuple[NDArray[Any], NDArray[Any]]:
+        min_index: int = int(np.searchsorted(
+            x_values,
+            cutoff_frequency,
+            side='right',
+        ))
+        return (x_values[min_index:], values[min_index:])
 
-            min_index = i + 1
+    def _bin_spectrum(
+        self,
+        x_values: NDArray[Any],
+        values: NDArray[Any],
+    ) -> tuple[NDArray[Any], NDArray[Any]]:
+        """
+        Reduces spectrum to at most `SPECTRUM_BINS` bins.
 
-        return (x_values[min_index:], values[min_index:])
+        Every bin takes the highest value within it so peaks stay comparable
+        with tresholds.
+        """
+        edges: NDArray[Any] = np.unique(np.linspace(
+            0,
+            len(values),
+            self.SPECTRUM_BINS,
+            endpoint=False,
+            dtype=int,
+        ))
+        sizes: NDArray[Any] = np.diff(edges, append=len(values)).astype(
+            np.float32,
+        )
+        centers: NDArray[Any] = np.add.reduceat(x_values, edges) / sizes
+        return (centers, np.maximum.reduceat(values, edges))
 
     @staticmethod
-    def generate_x_values(length: int, max_freq: float) -> list[float]:
+    def generate_x_values(length: int, max_freq: float) -> NDArray[np.float32]:
         """
         Generates array of frequencies in range [0; `max_freq`] with total
         length `length`.
-        """
 
-        if length in Visualizer.X_VALUES_MEMO:
-            return Visualizer.X_VALUES_MEMO[length]
+        Returned array is shared between calls and must not be modified.
+        """
 
-        result: list[float] = [0.0]
+        key: tuple[int, float] = (length, max_freq)
+        result: NDArray[np.float32] | None = Visualizer.X_VALUES_MEMO.get(key)
 
-        for i in range(1, length):
-            result.append(max_freq / (length - 1) * i)
+        if result is None:
+            result = np.linspace(0.0, max_freq, length, dtype=np.float32)
+            result.flags.writeable = False
+            Visualizer.X_VALUES_MEMO[key] = result
 
-        Visualizer.X_VALUES_MEMO[length] = result
         return result
 
     def process(self, data: NDArray[Any]) -> None:
@@ -79,30 +161,36 @@ class Visualizer:
         if mp_disabled:
             return
 
-        if self.main_graph is not None:
-            self.main_graph.remove()
-
         # if plot window is closed
         if self.plt_initialized and len(plt.get_fignums()) == 0:
             sys.exit(0)
 
+        if not self.plt_initialized:
+            self._init_plot()
+
         x_values = self.generate_x_values(
             len(data),
             self.sampling_rate / 2
         )
 
-        self.main_graph = plt.plot(
-            *self._cut_frequencies(
-                x_values,
-                data,
-                300,
-            ),
-            color=(0, 0, 1)
-        )[0]
+        xs, ys = self._bin_spectrum(*self._cut_frequencies(
+            x_values,
+            data,
+            300,
+        ))
+        self.main_graph.set_data(xs, ys)
+        rescaled: bool = self._fit_y(float(ys.max()))
 
-        plt.show(block=False)
-        plt.pause(0.001)
-        self.plt_initialized = True
+        x_range: tuple[float, float] = (float(xs[0]), float(xs[-1]))
+
+        if tuple(self.axes.get_xlim()) != x_range:
+            self.axes.set_xlim(*x_range)
+            rescaled = True
+
+        if rescaled:
+            self._redraw()
+
+        self._blit()
 
     def process_bits(
         self,
@@ -114,18 +202,27 @@ class Visualizer:
         if mp_disabled:
             return
 
-        for mark in self.freq_marks:
-            mark.remove()
-
-        self.freq_marks.clear()
+        if not self.plt_initialized:
+            return
 
         frequencies: list[float] = list(freq.all())
 
-        for i, bit in enumerate(bits_set):
+        while len(self.freq_marks) < len(bits_set):
+            self.freq_marks.append(self.axes.plot([], [], animated=True)[0])
+
+        for i, mark in enumerate(self.freq_marks):
+            if i >= len(bits_set):
+                mark.set_data([], [])
+                continue
+
             frequency = frequencies[i]
-            self.freq_marks.append(plt.plot(
+            mark.set_data(
                 [frequency - width / 2.0, frequency + width / 2.0],
                 [treshold, treshold],
-                color='#ff8000' if bit else '#0080ff',
-            )[0])
+            )
+            mark.set_color('#ff8000' if bits_set[i] else '#0080ff')
+
+        if self._fit_y(treshold):
+            self._redraw()
 
+        self._blit()
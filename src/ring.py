@@ -0,0 +1,78 @@
+"""
+Module with ring buffers used to pass audio between threads.
+"""
+
+import numpy as np
+from numpy.typing import NDArray
+
+
+class SampleRing:
+    """
+    Single-producer single-consumer ring buffer of fixed-size float32 sample
+    chunks.
+
+    Producer only advances `_tail` and consumer only advances `_head`, so
+    neither of them needs a lock. Storage is allocated once, pushing samples
+    only copies them into free slots.
+    """
+
+    _chunks: NDArray[np.float32]
+    _head: int
+    _tail: int
+
+    def __init__(self, slots: int, chunk_samples: int) -> None:
+        if slots <= 0:
+            raise ValueError('Expected `slots` to be positive')
+
+        if chunk_samples <= 0:
+            raise ValueError('Expected `chunk_samples` to be positive')
+
+        self._chunks = np.zeros((slots, chunk_samples), dtype=np.float32)
+        self._head = 0
+        self._tail = 0
+
+    def push(self, samples: NDArray[np.float32]) -> int:
+        """
+        Copies as many of `samples` as there are free slots for. Last chunk is
+        padded with zeroes.
+
+        Must only be called by the producer. Returns amount of samples pushed.
+        """
+        slots, chunk_samples = self._chunks.shape
+        tail: int = self._tail
+        free: int = slots - (tail - self._head)
+        count: int = min(free, -(-len(samples) // chunk_samples))
+
+        full: int = min(count, len(samples) // chunk_samples)
+
+        if full > 0:
+            # Whole chunks are copied at once through a reshaped view.
+            slots_indices: NDArray[np.intp] = (tail + np.arange(full)) % slots
+            self._chunks[slots_indices] = samples[:full * chunk_samples].reshape(full, chunk_samples)
+
+        if count > full:
+            remainder: NDArray[np.float32] = samples[full * chunk_samples:]
+            slot: NDArray[np.float32] = self._chunks[(tail + full) % slots]
+            slot[:len(remainder)] = remainder
+            slot[len(remainder):] = 0.0
+
+        # Chunks become visible to the consumer only after they were fully
+        # written.
+        self._tail = tail + count
+        return min(count * chunk_samples, len(samples))
+
+    def pop_into(self, out: NDArray[np.float32]) -> bool:
+        """
+        Copies the oldest chunk into `out` without allocating. Returns `False`
+        if there are no chunks.
+
+        Must only be called by the consumer.
+        """
+        head: int = self._head
+
+        if head == self._tail:
+            return False
+
+        np.copyto(out, self._chunks[head % self._chunks.shape[0]])
+        self._head = head + 1
+        return True
@@ -4,17 +4,29 @@ Module used for various operations with audio.
 
 from queue import Queue
 import queue
-from threading import Thread
-from array import array
-from time import sleep
+from threading import Event, Lock, Thread
 
 import math
-import time
 from typing import Any
 
 from pyaudio import PyAudio, Stream, paInt16
 
+import numpy as np
+
 from log import LOGGER
+from optional.jit import jit_disabled, njit, prange
+
+
+@njit(parallel=True, fastmath=True, cache=True)
+def _sine_wave_jit(frequency: float, samples_count: int,
+                   sampling_rate: int) -> np.ndarray:
+    result = np.empty(samples_count, dtype=np.float32)
+    step: float = math.tau * frequency / sampling_rate
+
+    for i in prange(samples_count):
+        result[i] = math.sin(step * i)
+
+    return result
 
 
 class SoundBatchSync:
@@ -25,12 +37,16 @@ class SoundBatchSync:
     For asynchronous (non-blocking) playing of sounds look at `SoundBatch`.
     """
 
+    # Maximum amount of tones kept in `_tone_cache`.
+    TONE_CACHE_SIZE: int = 256
+
     audio: PyAudio
     output_stream: Stream
 
     volume: float
     sampling_rate: int
     duration: float
+    _tone_cache: dict[tuple[float, int, int], np.ndarray]
 
     first_batch_played: bool = False
 
@@ -56,6 +72,7 @@ got {volume:.2f}')
         )
         self.volume = volume
         self.duration = duration
+        self._tone_cache = {}
 
     def play(self, sample: bytes) -> None:
         """
@@ -79,19 +96,51 @@ got {volume:.2f}')
         self.output_stream.close()
         self.audio.terminate()
 
+    def _tone(self, frequency: float, samples_count: int) -> np.ndarray:
+        """
+        Returns `samples_count` samples of a sine wave with given `frequency`.
+
+        Generated tones are cached, so frames sharing frequencies with the
+        previous ones do not recompute them.
+        """
+        key: tuple[float, int, int] = (frequency, samples_count,
+                                       self.sampling_rate)
+        wave: np.ndarray | None = self._tone_cache.get(key)
+
+        if wave is None:
+            if len(self._tone_cache) >= self.TONE_CACHE_SIZE:
+                self._tone_cache.clear()
+
+            if jit_disabled:
+                wave = np.sin(
+                    np.arange(samples_count, dtype=np.float32) *
+                    np.float32(math.tau * frequency / self.sampling_rate)
+                )
+            else:
+                wave = _sine_wave_jit(frequency, samples_count,
+                                      self.sampling_rate)
+
+            self._tone_cache[key] = wave
+
+        return wave
+
     def sample_frequencies(self, frequencies: list[float]) -> bytes:
         LOGGER.verbose_batch('Sampling:', frequencies)
         samples_count: int = int(self.sampling_rate * self.duration)
-        samples: list[float] = [0.0 for _i in range(samples_count)]
+        samples = np.zeros(samples_count, dtype=np.float32)
+
+        if len(frequencies) == 0:
+            return samples.tobytes()
 
-        for sample_i in range(0, samples_count):
-            for frequency in frequencies:
-                samples[sample_i] += math.sin(
-                    math.tau * sample_i * frequency / self.sampling_rate
-                ) * self.volume / len(frequencies)
+        tone = self._tone
+        gain: float = self.volume / len(frequencies)
 
-        samples_arr: array[float] = array('f', samples)
-        sampled_bytes: bytes = samples_arr.tobytes()
+        for frequency in frequencies:
+            samples += tone(frequency, samples_count)
+
+        samples *= gain
+
+        sampled_bytes: bytes = samples.astype(np.float32, copy=False).tobytes()
         return sampled_bytes
 
     def reset(self) -> None:
@@ -102,25 +151,31 @@ class SoundBatch:
     """
     Sound batch which is playing given sounds asynchronically (in another
     thread).
+
+    Sounds are sampled in the thread calling `enqueue()`, so the sound thread
+    only performs blocking writes to the output stream.
     """
 
     sync_batch: SoundBatchSync
     sound_thread: Thread
-    sampler_thread: Thread
     is_disposing: bool
-    frequencues_queue: Queue[list[float]]
     samples_queue: Queue[bytes]
+    # Amount of enqueued batches that were not played yet.
+    _pending: int
+    _pending_lock: Lock
+    _done_event: Event
 
     def __init__(self, **kwargs: Any) -> None:
         self.sync_batch = SoundBatchSync(**kwargs)
         self.sound_thread = Thread(target=self._sound_loop)
-        self.sampler_thread = Thread(target=self._sample_loop)
         self.is_disposing = False
-        self.frequencues_queue = Queue(maxsize=5)
         self.samples_queue = Queue(maxsize=64)
+        self._pending = 0
+        self._pending_lock = Lock()
+        self._done_event = Event()
+        self._done_event.set()
 
         self.sound_thread.start()
-        self.sampler_thread.start()
 
     def _cleanup(self) -> None:
         self.sync_batch.cleanup()
@@ -128,40 +183,33 @@ class SoundBatch:
     def _sound_loop(self) -> None:
         while not self.is_disposing:
             self.sync_batch.play(self.samples_queue.get())
+            self._finish_batches(1)
 
-    def _sample_loop(self) -> None:
-        while not self.is_disposing:
-            sample: bytes = self.sync_batch.sample_frequencies(
-                self.frequencues_queue.get(),
-            )
-            self.samples_queue.put(sample)
+    def _finish_batches(self, count: int) -> None:
+        with self._pending_lock:
+            self._pending = max(self._pending - count, 0)
+
+            if self._pending == 0:
+                self._done_event.set()
 
     def enqueue(self, frequencies: list[float]) -> None:
-        self.frequencues_queue.put(frequencies)
+        sample: bytes = self.sync_batch.sample_frequencies(frequencies)
+
+        with self._pending_lock:
+            self._pending += 1
+            self._done_event.clear()
 
-    def wait(self, timeout: float = -1.0, precision: float = 0.01) -> bool:
+        self.samples_queue.put(sample)
+
+    def wait(self, timeout: float = -1.0) -> bool:
         """
-        Sleeps every `precision` interval until either the batch will stop
-        playing or `timeout` will expire.
+        Blocks until either the batch will stop playing or `timeout` will
+        expire.
 
         If `timeout` is <= 0.0 then it will never expire.
         """
 
-        start_time: float = time.time()
-
-        while (
-            self.samples_queue.qsize() > 0 or
-            self.frequencues_queue.qsize() > 0
-        ):
-            sleep(precision)
-
-            if timeout <= 0.0:
-                continue
-
-            if time.time() - start_time >= timeout:
-                return False
-
-        return True
+        return self._done_event.wait(timeout if timeout > 0.0 else None)
 
     def reset(self) -> None:
         """
@@ -169,18 +217,16 @@ class SoundBatch:
         queued, cancels it.
         """
 
-        try:
-            while True:
-                self.frequencues_queue.get(block=False)
-        except queue.Empty:
-            pass
+        dropped: int = 0
 
         try:
             while True:
                 self.samples_queue.get(block=False)
+                dropped += 1
         except queue.Empty:
             pass
 
+        self._finish_batches(dropped)
         self.sync_batch.reset()
 
     def dispose(self, **kwargs: Any) -> None:
@@ -191,5 +237,4 @@ class SoundBatch:
         """
         self.is_disposing = True
         self.sound_thread.join(**kwargs)
-        self.sampler_thread.join(**kwargs)
         self.sync_batch.cleanup()
@@ -1,5 +1,6 @@
 import time
 import threading
+from collections import deque
 
 from log import LOGGER
 
@@ -20,16 +21,20 @@ class Stream:
 
 # Must only be used in one thread (but another thread may write to `input_buffer` considering `input_lock` or pop from `output_buffer` considering `output_lock`).
 class BufferedStream(Stream):
-    input_buffer: bytes
+    # Data is appended to its end and consumed from its start in place.
+    input_buffer: bytearray
     input_lock: threading.Lock
-    output_buffer: list[bytes] = []
+    # Chunks are written out in FIFO order. `append()` and `popleft()` of
+    # `deque` are atomic, so `write()` does not need `output_lock` to add
+    # chunks while another thread pops them.
+    output_buffer: deque[bytes]
     output_lock: threading.Lock
     _turn_write: bool
 
     def __init__(self, turn_write: bool) -> None:
-        self.input_buffer = bytes()
+        self.input_buffer = bytearray()
         self.input_lock = threading.Lock()
-        self.output_buffer = []
+        self.output_buffer = deque()
         self.output_lock = threading.Lock()
         self._turn_write = turn_write
 
@@ -38,6 +43,8 @@ class BufferedStream(Stream):
             with self.output_lock:
                 self._turn_write = not self._turn_write
 
+        self._output_changed()
+
     def turn_read(self) -> None:
         if not self._turn_write:
             return
@@ -46,6 +53,8 @@ class BufferedStream(Stream):
             with self.output_lock:
                 self._turn_write = False
 
+        self._output_changed()
+
     def turn_write(self) -> None:
         if self._turn_write:
             return
@@ -54,14 +63,20 @@ class BufferedStream(Stream):
             with self.output_lock:
                 self._turn_write = True
 
+        self._output_changed()
+
     def can_read(self) -> bool:
         return not self._turn_write
 
     def read(self, length: int, block: bool = True, precision: float = 0.05) -> bytes:
         with self.input_lock:
             if length <= len(self.input_buffer):
-                data: bytes = self.input_buffer[:length]
-                self.input_buffer = self.input_buffer[length:]
+                # Slicing a view copies data only once, the view is released
+                # before the buffer is resized.
+                with memoryview(self.input_buffer) as view:
+                    data: bytes = bytes(view[:length])
+
+                del self.input_buffer[:length]
 
                 if len(self.input_buffer) > 0:
                     LOGGER.verbose_warning('There is remaining data in input buffer after read:', len(self.input_buffer))
@@ -72,18 +87,20 @@ class BufferedStream(Stream):
                 return data
 
             if not block:
-                data: bytes = self.input_buffer
-                self.input_buffer = bytes()
+                data: bytes = bytes(self.input_buffer)
+                self.input_buffer.clear()
                 if len(data):
                     LOGGER.verbose_stream('Data was read (non-blocking):', data)
                 return data
 
         while length > len(self.input_buffer):
-            time.sleep(precision)
+            self.wait_input(None, length, precision)
 
         with self.input_lock:
-            data: bytes = self.input_buffer[:length]
-            self.input_buffer = self.input_buffer[length:]
+            with memoryview(self.input_buffer) as view:
+                data: bytes = bytes(view[:length])
+
+            del self.input_buffer[:length]
 
             if len(self.input_buffer) > 0:
                 LOGGER.verbose_warning('There is remaining data in input buffer after read:', len(self.input_buffer))
@@ -94,6 +111,37 @@ class BufferedStream(Stream):
                 LOGGER.verbose_stream('Data was read (blocking):', data)
             return data
 
+    def wait_input(self, timeout: float | None, size: int = 1, precision: float = 0.05) -> None:
+        """
+        Waits until there are at least `size` bytes in input buffer, but no
+        longer than `timeout` (forever if it is `None`). May return earlier,
+        callers must check input buffer themselves.
+
+        Streams which can not be notified about new input poll it every
+        `precision` seconds.
+        """
+        if timeout is not None:
+            precision = min(precision, timeout)
+
+        if precision > 0.0:
+            time.sleep(precision)
+
+    def _output_changed(self) -> None:
+        """
+        Called after output buffer or write turn was changed, so streams which
+        write from another thread may wake it up.
+        """
+
+    def wait_output(self, precision: float = 0.05) -> None:
+        """
+        Waits until everything from output buffer is written.
+
+        Streams which can not be notified about written output poll it every
+        `precision` seconds.
+        """
+        while len(self.output_buffer) > 0 or self.output_lock.locked():
+            time.sleep(precision)
+
     def can_write(self) -> bool:
         return self._turn_write
 
@@ -101,10 +149,10 @@ class BufferedStream(Stream):
         LOGGER.verbose_stream('Appending data:', data)
         self.output_buffer.append(data)
         LOGGER.verbose_stream('Total data:', self.output_buffer)
+        self._output_changed()
 
         if not block:
             return
 
-        while len(self.output_buffer) > 0 or self.output_lock.locked():
-            time.sleep(precision)
+        self.wait_output(precision)
 
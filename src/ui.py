@@ -14,8 +14,8 @@ class UIProcessor(NPSApp):
 
         self.transceiver = transceiver
 
-        # LOGGER.log_stdout_tags.clear()
-        LOGGER.log_stderr_tags.clear()
+        # LOGGER.set_log_tags(log_stdout_tags=[])
+        LOGGER.set_log_tags(log_stderr_tags=[])
         pyggwave.GGWave.disable_log()
 
     def main(self) -> None: